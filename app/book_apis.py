@@ -2,8 +2,105 @@
 Integração com Open Library API
 https://openlibrary.org/developers/api
 """
-import requests
-from typing import List, Dict, Optional
+import asyncio
+import re
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import catalog, search_index
+from .cache import persistent_cache, search_cache, search_cache_key
+from .config import settings
+from .http_client import http_get
+from .resilience import (
+    PRIORITY_INTERACTIVE,
+    breakers,
+    hedgers,
+    limiters
+)
+
+
+class SingleFlight:
+    """
+    Coalescência de requisições (single-flight).
+    
+    Chamadas concorrentes com a mesma chave aguardam uma única execução
+    em andamento e compartilham o resultado (ou a exceção).
+    """
+    
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Executa `fn` uma única vez por chave enquanto houver chamada em voo
+        
+        Args:
+            key: Chave normalizada da requisição
+            fn: Fábrica da corrotina que faz o trabalho real
+            
+        Returns:
+            Resultado compartilhado por todos os chamadores
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.followers += 1
+        
+        # shield: se um chamador for cancelado (ex.: prazo das recomendações),
+        # a requisição compartilhada continua para os demais
+        return await asyncio.shield(task)
+    
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Marca a exceção como lida mesmo que todos os chamadores tenham
+        # sido cancelados
+        if not task.cancelled():
+            task.exception()
+    
+    def stats(self) -> Dict[str, int]:
+        """Contadores de coalescência"""
+        return {
+            'in_flight': len(self._inflight),
+            'leaders': self.leaders,
+            'followers': self.followers
+        }
+
+
+# Buscas idênticas em voo são compartilhadas entre requisições
+search_flight = SingleFlight()
+
+# IDs aceitos ao buscar um livro na fonte (vêm do cliente e entram na URL)
+OL_WORK_RE = re.compile(r'OL\d+W')
+GOOGLE_VOLUME_RE = re.compile(r'[\w-]+')
+
+
+async def _guarded_get(
+    source: str,
+    url: str,
+    params: Optional[Dict] = None,
+    priority: int = PRIORITY_INTERACTIVE
+):
+    """
+    GET protegido pelo limitador de taxa e pelo circuit breaker da fonte
+    
+    Raises:
+        CircuitOpenError: Fonte desativada pelo circuit breaker
+        RateLimitedError: Sem token no prazo ou cota esgotada
+    """
+    # Circuit breaker: fonte doente é pulada na hora; timeout adaptativo.
+    # O token (e a cota) só é pego depois que o disjuntor admite a chamada
+    return await breakers[source].call(
+        lambda timeout: http_get(url, params=params, timeout=timeout),
+        before=lambda: limiters[source].acquire(priority)
+    )
 
 
 class OpenLibraryAPI:
@@ -12,45 +109,80 @@ class OpenLibraryAPI:
     BASE_URL = "https://openlibrary.org"
     SEARCH_URL = f"{BASE_URL}/search.json"
     COVERS_URL = "https://covers.openlibrary.org/b"
+    LANGUAGE = 'por,eng'
     
     @staticmethod
-    def search_books(query: str, limit: int = 20) -> List[Dict]:
+    async def _get(
+        url: str,
+        params: Optional[Dict] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ):
+        """GET na Open Library, com hedging se OPENLIBRARY_HEDGING estiver ativo"""
+        fetch = lambda: _guarded_get('openlibrary', url, params=params, priority=priority)
+        if settings.OPENLIBRARY_HEDGING:
+            return await hedgers['openlibrary'].run(fetch)
+        return await fetch()
+    
+    @staticmethod
+    async def search_books(
+        query: str,
+        limit: int = 20,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> List[Dict]:
         """
-        Buscar livros na Open Library
+        Buscar livros na Open Library (com cache TTL/LRU)
         
         Args:
             query: Termo de busca
             limit: Número máximo de resultados
+            priority: Prioridade no limitador de taxa
             
         Returns:
             Lista de livros formatados
         """
-        try:
-            response = requests.get(
-                OpenLibraryAPI.SEARCH_URL,
-                params={
-                    'q': query,
-                    'limit': limit,
-                    'fields': 'key,title,author_name,first_publish_year,'
-                             'isbn,subject,ratings_average,cover_i',
-                    'language': 'por,eng'
-                },
-                timeout=10
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            books = []
-            for doc in data.get('docs', []):
-                book = OpenLibraryAPI._format_book(doc)
-                if book:
-                    books.append(book)
-            
+        key = search_cache_key('openlibrary', query, limit, OpenLibraryAPI.LANGUAGE)
+        cached = search_cache.get(key)
+        if cached is not None:
+            return [dict(book) for book in cached]
+        
+        async def fetch():
+            books = await OpenLibraryAPI._fetch_search(query, limit, priority)
+            # Só respostas bem-sucedidas entram no cache
+            search_cache.set(key, books)
             return books
-            
+        
+        try:
+            books = await search_flight.do(key, fetch)
         except Exception as e:
             print(f"Erro ao buscar na Open Library: {e}")
-            return []
+            # Modo degradado: uma resposta antiga é melhor que nenhuma
+            stale = search_cache.get_stale(key)
+            return [dict(book) for book in stale] if stale else []
+        
+        return [dict(book) for book in books]
+    
+    @staticmethod
+    async def _fetch_search(query: str, limit: int, priority: int) -> List[Dict]:
+        """Consulta a Open Library sem cache (propaga erros)"""
+        params = {
+            'q': query,
+            'limit': limit,
+            'fields': 'key,title,author_name,first_publish_year,'
+                     'isbn,subject,ratings_average,cover_i',
+            'language': OpenLibraryAPI.LANGUAGE
+        }
+        response = await OpenLibraryAPI._get(
+            OpenLibraryAPI.SEARCH_URL, params=params, priority=priority
+        )
+        data = response.json()
+        
+        books = []
+        for doc in data.get('docs', []):
+            book = OpenLibraryAPI._format_book(doc)
+            if book:
+                books.append(book)
+        
+        return books
     
     @staticmethod
     def _format_book(doc: Dict) -> Optional[Dict]:
@@ -101,7 +233,7 @@ class OpenLibraryAPI:
             return None
     
     @staticmethod
-    def get_book_details(work_id: str) -> Optional[Dict]:
+    async def get_book_details(work_id: str) -> Optional[Dict]:
         """
         Obter detalhes completos de um livro
         
@@ -111,86 +243,200 @@ class OpenLibraryAPI:
         Returns:
             Detalhes do livro
         """
+        # Se o ID vier com ol_ prefix, extrair o ID real
+        if work_id.startswith('ol_'):
+            work_id = '/works/' + work_id.replace('ol_', '')
+        
+        key = ('openlibrary_details', work_id)
+        if persistent_cache is not None:
+            cached = await asyncio.to_thread(persistent_cache.get, key)
+            if cached is not None:
+                return cached
+        
         try:
-            # Se o ID vier com ol_ prefix, extrair o ID real
-            if work_id.startswith('ol_'):
-                work_id = '/works/' + work_id.replace('ol_', '')
+            details = await OpenLibraryAPI._fetch_details(work_id)
+        except Exception as e:
+            print(f"Erro ao obter detalhes: {e}")
+            return None
+        
+        if persistent_cache is not None:
+            await asyncio.to_thread(persistent_cache.set, key, details)
+        
+        return details
+    
+    @staticmethod
+    async def _fetch_details(work_id: str) -> Dict:
+        """Consulta os detalhes do work sem cache (propaga erros)"""
+        response = await OpenLibraryAPI._get(f"{OpenLibraryAPI.BASE_URL}{work_id}.json")
+        data = response.json()
+        
+        # Obter descrição completa
+        description = ""
+        if 'description' in data:
+            desc = data['description']
+            if isinstance(desc, dict):
+                description = desc.get('value', '')
+            else:
+                description = str(desc)
+        
+        return {
+            'description': description,
+            'subjects': data.get('subjects', []),
+            'covers': data.get('covers', [])
+        }
+    
+    @staticmethod
+    async def get_book(work_id: str) -> Optional[Dict]:
+        """
+        Obter um livro pelo work, no formato padrão (para o catálogo)
+        
+        Args:
+            work_id: ID do work (ex: OL45804W)
             
-            response = requests.get(
-                f"{OpenLibraryAPI.BASE_URL}{work_id}.json",
-                timeout=10
-            )
-            response.raise_for_status()
+        Returns:
+            Livro formatado, ou None se não existir ou a fonte falhar
+        """
+        if not OL_WORK_RE.fullmatch(work_id):
+            return None
+        
+        try:
+            response = await OpenLibraryAPI._get(f"{OpenLibraryAPI.BASE_URL}/works/{work_id}.json")
             data = response.json()
             
-            # Obter descrição completa
-            description = ""
-            if 'description' in data:
-                desc = data['description']
-                if isinstance(desc, dict):
-                    description = desc.get('value', '')
-                else:
-                    description = str(desc)
-            
-            return {
-                'description': description,
-                'subjects': data.get('subjects', []),
-                'covers': data.get('covers', [])
-            }
-            
+            # O work só traz as chaves dos autores; os nomes vêm de outra consulta
+            author_keys = [
+                a['author']['key'] for a in data.get('authors', [])
+                if isinstance(a.get('author'), dict) and a['author'].get('key')
+            ][:3]
+            author_responses = await asyncio.gather(*(
+                OpenLibraryAPI._get(f"{OpenLibraryAPI.BASE_URL}{key}.json") for key in author_keys
+            ))
         except Exception as e:
-            print(f"Erro ao obter detalhes: {e}")
+            print(f"Erro ao obter livro: {e}")
             return None
+        
+        description = data.get('description', '')
+        if isinstance(description, dict):
+            description = description.get('value', '')
+        
+        authors = [r.json().get('name') for r in author_responses]
+        covers = [c for c in data.get('covers', []) if c and c > 0]
+        thumbnail = f"{OpenLibraryAPI.COVERS_URL}/id/{covers[0]}-M.jpg" if covers else ""
+        
+        return {
+            'id': f'ol_{work_id}',
+            'title': data.get('title', 'Sem título'),
+            'authors': [name for name in authors if name],
+            'description': str(description),
+            'categories': data.get('subjects', [])[:3],
+            'rating': 0,
+            'thumbnail': thumbnail,
+            'source': 'openlibrary'
+        }
 
 
 class GoogleBooksAPI:
     """Cliente para Google Books API (já existente, refatorado)"""
     
     BASE_URL = "https://www.googleapis.com/books/v1/volumes"
+    LANGUAGE = 'pt'
     
     @staticmethod
-    def search_books(query: str, api_key: str = "", limit: int = 20) -> List[Dict]:
+    async def search_books(
+        query: str,
+        api_key: str = "",
+        limit: int = 20,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> List[Dict]:
         """
-        Buscar livros no Google Books
+        Buscar livros no Google Books (com cache TTL/LRU)
         
         Args:
             query: Termo de busca
             api_key: API Key do Google (opcional)
             limit: Número máximo de resultados
+            priority: Prioridade no limitador de taxa
             
         Returns:
             Lista de livros formatados
         """
+        key = search_cache_key('google', query, limit, GoogleBooksAPI.LANGUAGE)
+        cached = search_cache.get(key)
+        if cached is not None:
+            return [dict(book) for book in cached]
+        
+        async def fetch():
+            books = await GoogleBooksAPI._fetch_search(query, api_key, limit, priority)
+            # Só respostas bem-sucedidas entram no cache
+            search_cache.set(key, books)
+            return books
+        
         try:
-            params = {
-                'q': query,
-                'maxResults': limit,
-                'langRestrict': 'pt',
-                'printType': 'books'
-            }
-            
-            if api_key:
-                params['key'] = api_key
+            books = await search_flight.do(key, fetch)
+        except Exception as e:
+            print(f"Erro ao buscar no Google Books: {e}")
+            # Modo degradado: uma resposta antiga é melhor que nenhuma
+            stale = search_cache.get_stale(key)
+            return [dict(book) for book in stale] if stale else []
+        
+        return [dict(book) for book in books]
+    
+    @staticmethod
+    async def _fetch_search(
+        query: str,
+        api_key: str,
+        limit: int,
+        priority: int
+    ) -> List[Dict]:
+        """Consulta o Google Books sem cache (propaga erros)"""
+        params = {
+            'q': query,
+            'maxResults': limit,
+            'langRestrict': GoogleBooksAPI.LANGUAGE,
+            'printType': 'books'
+        }
+        
+        if api_key:
+            params['key'] = api_key
+        
+        response = await _guarded_get(
+            'google', GoogleBooksAPI.BASE_URL, params=params, priority=priority
+        )
+        data = response.json()
+        
+        books = []
+        for item in data.get('items', []):
+            book = GoogleBooksAPI._format_book(item)
+            if book:
+                books.append(book)
+        
+        return books
+    
+    @staticmethod
+    async def get_book(volume_id: str, api_key: str = "") -> Optional[Dict]:
+        """
+        Obter um livro pelo ID do volume, no formato padrão (para o catálogo)
+        
+        Args:
+            volume_id: ID do volume no Google Books
+            api_key: API Key do Google (opcional)
             
-            response = requests.get(
-                GoogleBooksAPI.BASE_URL,
-                params=params,
-                timeout=10
+        Returns:
+            Livro formatado, ou None se não existir ou a fonte falhar
+        """
+        if not GOOGLE_VOLUME_RE.fullmatch(volume_id):
+            return None
+        
+        params = {'key': api_key} if api_key else None
+        try:
+            response = await _guarded_get(
+                'google', f"{GoogleBooksAPI.BASE_URL}/{volume_id}", params=params
             )
-            response.raise_for_status()
-            data = response.json()
-            
-            books = []
-            for item in data.get('items', []):
-                book = GoogleBooksAPI._format_book(item)
-                if book:
-                    books.append(book)
-            
-            return books
-            
         except Exception as e:
-            print(f"Erro ao buscar no Google Books: {e}")
-            return []
+            print(f"Erro ao obter livro: {e}")
+            return None
+        
+        return GoogleBooksAPI._format_book(response.json())
     
     @staticmethod
     def _format_book(item: Dict) -> Optional[Dict]:
@@ -218,48 +464,170 @@ class UnifiedBookAPI:
     """API unificada que busca em múltiplas fontes"""
     
     @staticmethod
-    def search_books(
+    async def search_books(
         query: str,
         sources: List[str] = ['google', 'openlibrary'],
         limit_per_source: int = 10,
-        google_api_key: str = ""
+        google_api_key: str = "",
+        concurrent: bool = True,
+        db: Optional[Session] = None,
+        priority: int = PRIORITY_INTERACTIVE
     ) -> List[Dict]:
         """
         Buscar livros em múltiplas fontes
         
         Args:
             query: Termo de busca
-            sources: Lista de fontes ('google', 'openlibrary')
+            sources: Lista de fontes ('google', 'openlibrary', 'local')
             limit_per_source: Limite por fonte
             google_api_key: API Key do Google Books
+            concurrent: Consultar as fontes em paralelo (fan-out)
+            db: Sessão do banco; se informada, o catálogo local é consultado
+                primeiro e alimentado com os resultados das APIs
+            priority: Prioridade no limitador de taxa (busca interativa ou
+                pré-busca de recomendações)
             
         Returns:
             Lista unificada de livros (sem duplicatas)
         """
-        all_books = []
+        active = [s for s in ('google', 'openlibrary') if s in sources]
+        # 'local' (índice full-text do catálogo) precisa de uma sessão do banco
+        if 'local' in sources and db is not None:
+            active.append('local')
+        remote = [s for s in active if s != 'local']
         
-        # Buscar no Google Books
-        if 'google' in sources:
-            google_books = GoogleBooksAPI.search_books(
-                query, 
-                api_key=google_api_key,
-                limit=limit_per_source
-            )
-            all_books.extend(google_books)
+        # Resultado já formatado pode estar no cache persistente (compartilhado
+        # entre workers e sobrevive a restarts). O catálogo local já é rápido
+        # e muda a cada busca, então não passa por ele
+        use_persistent = persistent_cache is not None and remote == active and active
+        persistent_key = (
+            'unified',
+            ' '.join(query.lower().split()),
+            active,
+            int(limit_per_source)
+        )
+        if use_persistent:
+            cached = await asyncio.to_thread(persistent_cache.get, persistent_key)
+            if cached is not None:
+                return cached
         
-        # Buscar na Open Library
-        if 'openlibrary' in sources:
-            ol_books = OpenLibraryAPI.search_books(
+        # Catálogo local primeiro: se já houver resultados suficientes, nenhuma
+        # chamada de rede é feita. Só valem livros das fontes pedidas
+        if db is not None and settings.CATALOG_LOCAL_FIRST and remote == active and active:
+            try:
+                local_books = search_index.search(
+                    db, query, limit=limit_per_source * len(active), sources=remote
+                )
+                if len(local_books) >= limit_per_source:
+                    return UnifiedBookAPI._remove_duplicates(local_books)
+            except Exception as e:
+                print(f"Erro ao buscar no catálogo local: {e}")
+                db.rollback()
+        
+        # Disparar todas as fontes em paralelo: a latência passa a ser a da
+        # fonte mais lenta, e não a soma de todas
+        fetchers = {
+            'google': lambda: GoogleBooksAPI.search_books(
+                query,
+                api_key=google_api_key,
+                limit=limit_per_source,
+                priority=priority
+            ),
+            'openlibrary': lambda: OpenLibraryAPI.search_books(
+                query,
+                limit=limit_per_source,
+                priority=priority
+            ),
+            'local': lambda: UnifiedBookAPI._search_local(
+                db,
                 query,
                 limit=limit_per_source
+            ),
+        }
+        
+        results_by_source = {}
+        if not concurrent:
+            for s in active:
+                results_by_source[s] = await fetchers[s]()
+        elif active:
+            async def fetch(source: str):
+                return source, await fetchers[source]()
+            
+            for next_done in asyncio.as_completed([fetch(s) for s in active]):
+                source, books = await next_done
+                results_by_source[source] = books
+        
+        # Modo degradado: fontes sem resposta (limite de taxa, circuito
+        # aberto, erro) são compensadas pelo que o catálogo local tem delas
+        missing = [s for s in remote if not results_by_source.get(s)]
+        if missing and db is not None and 'local' not in active:
+            results_by_source['local'] = await UnifiedBookAPI._search_local(
+                db, query, limit=limit_per_source * len(missing), sources=missing
             )
-            all_books.extend(ol_books)
+        
+        # Juntar na ordem fixa das fontes (Google primeiro), para que a
+        # deduplicação mantenha a mesma preferência de antes
+        all_books = []
+        for s in active + (['local'] if 'local' not in active else []):
+            all_books.extend(results_by_source.get(s, []))
+        
+        # Espelhar no catálogo local só os livros novos: os que já estão lá
+        # (ex.: importados do dump, com descrição completa) não são trocados
+        # pelo resumo da busca. Sessão própria: o commit não expira os objetos
+        # já carregados na sessão de quem chamou
+        remote_books = [b for s in remote for b in results_by_source.get(s, [])]
+        if db is not None and settings.CATALOG_ENABLED and remote_books:
+            with Session(db.get_bind()) as mirror_db:
+                try:
+                    catalog.upsert_books(mirror_db, remote_books, update_existing=False)
+                except Exception as e:
+                    print(f"Erro ao gravar no catálogo local: {e}")
+                    mirror_db.rollback()
         
         # Remover duplicatas por título similar
         unique_books = UnifiedBookAPI._remove_duplicates(all_books)
         
+        # Só persistir quando todas as fontes responderam: uma fonte fora do
+        # ar devolve [] e não deve congelar um resultado parcial no disco
+        if use_persistent and all(results_by_source.get(s) for s in active):
+            await asyncio.to_thread(persistent_cache.set, persistent_key, unique_books)
+        
         return unique_books
     
+    @staticmethod
+    async def get_book(book_id: str, google_api_key: str = "") -> Optional[Dict]:
+        """
+        Obter um livro na fonte de origem pelo ID do catálogo (gb_<id> ou ol_<work>)
+        
+        Returns:
+            Livro formatado, ou None se o ID for inválido ou o livro não for encontrado
+        """
+        if book_id.startswith('gb_'):
+            book = await GoogleBooksAPI.get_book(book_id[3:], api_key=google_api_key)
+        elif book_id.startswith('ol_'):
+            book = await OpenLibraryAPI.get_book(book_id[3:])
+        else:
+            return None
+        # A fonte pode devolver outro ID (ex.: volume redirecionado)
+        if book is None or book['id'] != book_id:
+            return None
+        return book
+    
+    @staticmethod
+    async def _search_local(
+        db: Session,
+        query: str,
+        limit: int,
+        sources: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """Fonte 'local': índice full-text do catálogo (opcionalmente só de algumas fontes)"""
+        try:
+            return search_index.search(db, query, limit=limit, sources=sources)
+        except Exception as e:
+            print(f"Erro ao buscar no catálogo local: {e}")
+            db.rollback()
+            return []
+    
     @staticmethod
     def _remove_duplicates(books: List[Dict]) -> List[Dict]:
         """Remove duplicatas baseado em similaridade de título"""
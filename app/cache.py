@@ -0,0 +1,250 @@
+"""
+Caches para respostas das APIs de livros:
+
+- TTLCache: em memória (TTL + LRU), por processo
+- SQLiteCache: persistente em disco, compartilhado pelos workers do host
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from .config import settings
+
+
+class TTLCache:
+    """
+    Cache com expiração por tempo (TTL) e limite de tamanho (LRU).
+
+    Cada entrada expira `ttl` segundos após ser gravada; quando o cache
+    passa de `maxsize` entradas, a menos usada recentemente é descartada.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 900):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Retorna o valor ou `default` se ausente/expirado"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                # Entradas expiradas ficam até a evicção LRU, para get_stale
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key: Hashable, default: Any = None) -> Any:
+        """Retorna o valor mesmo se expirado (modo degradado)"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self.stale_hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Grava o valor, descartando as entradas mais antigas se necessário"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Remove uma entrada. Retorna True se ela existia"""
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Remove todas as entradas cuja chave satisfaz `predicate`"""
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        """Esvazia o cache (os contadores são mantidos)"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso do cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'stale_hits': self.stale_hits,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache:
+    """
+    Cache persistente em arquivo SQLite, compartilhável entre processos.
+
+    Os valores são serializados em JSON. O modo WAL permite leituras
+    concorrentes de vários workers; a compactação remove entradas expiradas
+    e, acima de `maxsize`, as que expiram primeiro.
+    """
+
+    COMPACT_EVERY = 200  # gravações entre compactações automáticas
+
+    def __init__(self, path: str, maxsize: int = 50_000, ttl: float = 86_400):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_cache_expires_at ON cache (expires_at)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        """Uma conexão por thread (sqlite3 não compartilha entre threads)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _encode_key(key: Hashable) -> str:
+        return json.dumps(key, ensure_ascii=False, separators=(',', ':'))
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Retorna o valor ou `default` se ausente/expirado"""
+        row = self._connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+            (self._encode_key(key), time.time())
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Grava o valor; compacta o arquivo periodicamente"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._connect().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (self._encode_key(key), json.dumps(value, ensure_ascii=False), expires_at)
+        )
+        self._writes += 1
+        if self._writes % self.COMPACT_EVERY == 0:
+            self.compact()
+
+    def invalidate(self, key: Hashable) -> bool:
+        """Remove uma entrada. Retorna True se ela existia"""
+        cursor = self._connect().execute(
+            "DELETE FROM cache WHERE key = ?", (self._encode_key(key),)
+        )
+        return cursor.rowcount > 0
+
+    def clear(self) -> None:
+        """Esvazia o cache"""
+        self._connect().execute("DELETE FROM cache")
+
+    def compact(self, vacuum: bool = False) -> int:
+        """
+        Remove entradas expiradas e o excedente acima de `maxsize`
+
+        Args:
+            vacuum: Também devolve o espaço livre ao sistema (mais lento)
+
+        Returns:
+            Número de entradas removidas
+        """
+        conn = self._connect()
+        removed = conn.execute(
+            "DELETE FROM cache WHERE expires_at <= ?", (time.time(),)
+        ).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.maxsize
+        if excess > 0:
+            removed += conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY expires_at LIMIT ?)",
+                (excess,)
+            ).rowcount
+        if vacuum:
+            conn.execute("VACUUM")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso (hits/misses são do processo atual)"""
+        size = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'size': size,
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0
+        }
+
+
+def search_cache_key(source: str, query: str, limit: int, language: str) -> Tuple:
+    """Chave normalizada (fonte, consulta, limite, idioma) para buscas"""
+    normalized_query = ' '.join(query.lower().split())
+    return (source, normalized_query, int(limit), language)
+
+
+# Cache único compartilhado pelas fontes de livros
+search_cache = TTLCache(
+    maxsize=settings.SEARCH_CACHE_MAXSIZE,
+    ttl=settings.SEARCH_CACHE_TTL
+)
+
+# Cache persistente opcional (desativado se PERSISTENT_CACHE_PATH não definido)
+persistent_cache: Optional[SQLiteCache] = (
+    SQLiteCache(
+        settings.PERSISTENT_CACHE_PATH,
+        maxsize=settings.PERSISTENT_CACHE_MAXSIZE,
+        ttl=settings.PERSISTENT_CACHE_TTL
+    )
+    if settings.PERSISTENT_CACHE_PATH else None
+)
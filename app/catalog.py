@@ -0,0 +1,243 @@
+"""
+Catálogo local de livros
+
+Todo livro formatado pelas APIs externas (`_format_book`) é gravado na
+tabela `books`, e buscas repetidas podem ser atendidas localmente.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.orm import Session
+
+from .database import dialect_insert
+from .models import Author, Book, Category, book_authors, book_categories
+
+
+# Caracteres da descrição exibidos no card da biblioteca
+SNIPPET_LENGTH = 150
+
+
+def make_snippet(description: Optional[str]) -> str:
+    """Trecho da descrição gravado em `description_snippet`"""
+    description = description or ''
+    if len(description) > SNIPPET_LENGTH:
+        return description[:SNIPPET_LENGTH] + '...'
+    return description
+
+
+def name_key(name: str) -> str:
+    """Chave de comparação de autores e categorias"""
+    return name.strip().lower()[:255]
+
+
+def book_to_row(book: Dict) -> Dict:
+    """Converter o formato padrão (listas) para a linha da tabela (texto)"""
+    return {
+        'id': book['id'],
+        'title': (book.get('title') or 'Sem título')[:500],
+        'authors': ','.join(book.get('authors') or []),
+        'description': book.get('description') or '',
+        'description_snippet': make_snippet(book.get('description')),
+        'categories': ','.join(book.get('categories') or []),
+        'rating': float(book.get('rating') or 0),
+        'thumbnail': (book.get('thumbnail') or '')[:500],
+        'source': book.get('source') or '',
+        'updated_at': datetime.utcnow()
+    }
+
+
+def row_to_book(row: Book) -> Dict:
+    """Converter a linha da tabela para o formato padrão das APIs"""
+    return {
+        'id': row.id,
+        'title': row.title,
+        'authors': [a.strip() for a in (row.authors or '').split(',') if a.strip()],
+        'description': row.description or '',
+        'categories': [c.strip() for c in (row.categories or '').split(',') if c.strip()],
+        'rating': row.rating or 0,
+        'thumbnail': row.thumbnail or '',
+        'source': row.source
+    }
+
+
+# Linhas por comando nas gravações em lote (limite de parâmetros do SQLite)
+CHUNK_SIZE = 500
+
+
+def _chunks(items: List, size: int = CHUNK_SIZE) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def upsert_books(
+    db: Session,
+    books: Iterable[Dict],
+    commit: bool = True,
+    update_existing: bool = True
+) -> int:
+    """
+    Inserir ou atualizar livros no catálogo
+
+    Args:
+        db: Sessão do banco
+        books: Livros no formato padrão de `_format_book`
+        commit: Confirmar a transação ao final
+        update_existing: Se False, livros já existentes são mantidos como estão
+
+    Returns:
+        Número de livros gravados
+    """
+    # Um mesmo id só pode aparecer uma vez por comando ON CONFLICT
+    books = list({book['id']: book for book in books if book and book.get('id')}.values())
+    rows = {book['id']: book_to_row(book) for book in books}
+    if not rows:
+        return 0
+
+    if not update_existing:
+        # Só os livros novos ganham ligações; os existentes ficam como estão
+        existing = set()
+        for chunk in _chunks(list(rows)):
+            existing.update(db.scalars(select(Book.id).where(Book.id.in_(chunk))))
+        books = [book for book in books if book['id'] not in existing]
+
+    insert = dialect_insert(db)
+    for chunk in _chunks(list(rows.values())):
+        stmt = insert(Book).values(chunk)
+        if update_existing:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Book.id],
+                set_={
+                    column: stmt.excluded[column]
+                    for column in ('title', 'authors', 'description', 'description_snippet',
+                                   'categories', 'rating', 'thumbnail', 'source', 'updated_at')
+                }
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[Book.id])
+        db.execute(stmt)
+    sync_book_links(db, books)
+    if commit:
+        db.commit()
+    return len(rows)
+
+
+def lookup_name_ids(db: Session, model, keys: Iterable[str]) -> Dict[str, int]:
+    """{name_key: id} dos autores/categorias já cadastrados"""
+    ids = {}
+    for chunk in _chunks(list(set(keys))):
+        ids.update(db.execute(
+            select(model.name_key, model.id).where(model.name_key.in_(chunk))
+        ).all())
+    return ids
+
+
+def _upsert_names(db: Session, model, names: Dict[str, str]) -> Dict[str, int]:
+    """Garantir as linhas de Author/Category e devolver {name_key: id}"""
+    insert = dialect_insert(db)
+    for chunk in _chunks(list(names.items())):
+        db.execute(insert(model).values([
+            {'name': name[:255], 'name_key': key} for key, name in chunk
+        ]).on_conflict_do_nothing(index_elements=['name_key']))
+    return lookup_name_ids(db, model, names)
+
+
+def sync_book_links(db: Session, books: Iterable[Dict]) -> None:
+    """
+    Regravar as ligações livro -> autores/categorias de um lote de livros
+
+    Args:
+        db: Sessão do banco (a transação é confirmada por quem chama)
+        books: Livros no formato padrão, já gravados em `books`
+    """
+    books = list(books)
+    if not books:
+        return
+    book_ids = [book['id'] for book in books]
+    insert = dialect_insert(db)
+
+    for table, field, model, column in (
+        (book_authors, 'authors', Author, 'author_id'),
+        (book_categories, 'categories', Category, 'category_id'),
+    ):
+        names = {}
+        pairs = []
+        for book in books:
+            for name in book.get(field) or []:
+                key = name_key(name)
+                if key:
+                    names.setdefault(key, name.strip())
+                    pairs.append((book['id'], key))
+
+        ids = _upsert_names(db, model, names)
+        links = list(dict.fromkeys((book_id, ids[key]) for book_id, key in pairs if key in ids))
+
+        for chunk in _chunks(book_ids):
+            db.execute(delete(table).where(table.c.book_id.in_(chunk)))
+        for chunk in _chunks(links):
+            db.execute(insert(table).values([
+                {'book_id': book_id, column: link_id} for book_id, link_id in chunk
+            ]).on_conflict_do_nothing())
+
+
+def linked_ids(db: Session, book_ids: Iterable[str]) -> Tuple[Set[int], Set[int]]:
+    """Ids de (categorias, autores) ligados a um conjunto de livros"""
+    book_ids = set(book_ids)
+    if not book_ids:
+        return set(), set()
+    category_ids = set(db.scalars(
+        select(book_categories.c.category_id).where(book_categories.c.book_id.in_(book_ids))
+    ))
+    author_ids = set(db.scalars(
+        select(book_authors.c.author_id).where(book_authors.c.book_id.in_(book_ids))
+    ))
+    return category_ids, author_ids
+
+
+def _escape_like(term: str) -> str:
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_local(
+    db: Session,
+    query: str,
+    limit: int = 20,
+    sources: Optional[Iterable[str]] = None
+) -> List[Dict]:
+    """
+    Buscar no catálogo local
+
+    Entende os mesmos prefixos usados nas recomendações:
+    `subject:<categoria>` e `author:<autor>`. Caso contrário, todos os
+    termos devem aparecer no título, autores ou categorias.
+
+    Args:
+        query: Termo de busca
+        limit: Número máximo de resultados
+        sources: Só livros vindos destas fontes (None = todas)
+
+    Returns:
+        Lista de livros no formato padrão
+    """
+    query = query.strip()
+    q = db.query(Book)
+    if sources is not None:
+        q = q.filter(Book.source.in_(list(sources)))
+
+    if query.lower().startswith('subject:'):
+        term = _escape_like(query[len('subject:'):].strip())
+        q = q.filter(Book.categories.ilike(f'%{term}%', escape='\\'))
+    elif query.lower().startswith('author:'):
+        term = _escape_like(query[len('author:'):].strip())
+        q = q.filter(Book.authors.ilike(f'%{term}%', escape='\\'))
+    else:
+        for term in query.split():
+            pattern = f'%{_escape_like(term)}%'
+            q = q.filter(or_(
+                Book.title.ilike(pattern, escape='\\'),
+                Book.authors.ilike(pattern, escape='\\'),
+                Book.categories.ilike(pattern, escape='\\')
+            ))
+
+    rows = q.order_by(Book.rating.desc(), Book.title).limit(limit).all()
+    return [row_to_book(row) for row in rows]
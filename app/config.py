@@ -17,6 +17,82 @@ class Settings(BaseSettings):
     #External API
     GOOGLE_BOOKS_API_KEY: str | None = None
 
+    # HTTP client (pool compartilhado pelas fontes externas)
+    HTTP_TIMEOUT: float = 10.0
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_MAX_KEEPALIVE: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP2_ENABLED: bool = False
+
+    # Circuit breaker e timeout adaptativo por fonte
+    CIRCUIT_FAILURE_THRESHOLD: int = 5  # falhas seguidas para abrir
+    CIRCUIT_RECOVERY_TIME: float = 30.0  # segundos até a chamada de teste
+    ADAPTIVE_TIMEOUT_PERCENTILE: float = 99.0
+    ADAPTIVE_TIMEOUT_MULTIPLIER: float = 2.0
+    ADAPTIVE_TIMEOUT_MIN: float = 1.0  # o máximo é HTTP_TIMEOUT
+
+    # Limite de taxa por fonte (token bucket)
+    GOOGLE_RATE_LIMIT: float = 5.0  # requisições/segundo
+    GOOGLE_RATE_BURST: int = 10
+    GOOGLE_DAILY_QUOTA: int | None = 1000  # None = sem cota
+    OPENLIBRARY_RATE_LIMIT: float = 5.0
+    OPENLIBRARY_RATE_BURST: int = 10
+    RATE_LIMIT_MAX_WAIT: float = 2.0  # espera máxima da busca interativa
+    RATE_LIMIT_PREFETCH_MAX_WAIT: float = 0.5  # espera máxima das recomendações
+
+    # Hedging de requisições da Open Library (opt-in)
+    OPENLIBRARY_HEDGING: bool = False
+    HEDGE_PERCENTILE: float = 90.0  # espera antes da duplicata
+    HEDGE_BUDGET_RATIO: float = 0.1  # duplicatas / chamadas primárias
+    HEDGE_MIN_DELAY: float = 0.05  # segundos
+
+    # Cache de buscas nas APIs externas
+    SEARCH_CACHE_TTL: int = 900  # segundos
+    SEARCH_CACHE_MAXSIZE: int = 1024  # entradas
+
+    # Cache persistente em disco (SQLite), compartilhado pelos workers
+    PERSISTENT_CACHE_PATH: str | None = None  # ex: "data/cache.sqlite3"
+    PERSISTENT_CACHE_TTL: int = 60 * 60 * 24  # segundos
+    PERSISTENT_CACHE_MAXSIZE: int = 50_000  # entradas
+
+    # Catálogo local (espelho dos resultados das APIs)
+    CATALOG_ENABLED: bool = True
+    CATALOG_LOCAL_FIRST: bool = True
+
+    # Busca progressiva (SSE): cada fonte aparece assim que responde
+    SEARCH_STREAMING: bool = True
+
+    # Biblioteca
+    LIBRARY_PAGE_SIZE: int = 24
+    # Contadores por usuário mantidos na escrita (tabela user_stats);
+    # desligado, o dashboard usa um único GROUP BY por visita
+    STATS_COUNTERS_ENABLED: bool = False
+
+    # Recomendações
+    RECOMMENDATION_DEADLINE: float = 4.0  # segundos para gerar candidatos
+    # TF-IDF treinado offline (python -m app.featurizers fit); sem o arquivo,
+    # o vetorizador é treinado a cada requisição
+    TFIDF_MODEL_PATH: str | None = "models/tfidf.joblib"
+    # "tfidf" (vocabulário treinado) ou "hashing" (HashingVectorizer + IDF fixo)
+    RECOMMENDATION_FEATURIZER: str = "tfidf"
+    HASHING_N_FEATURES: int = 2 ** 18
+    HASHING_IDF_PATH: str | None = "models/hashing_idf.joblib"
+    # Perfil de gosto por usuário persistido e atualizado a cada mudança na
+    # biblioteca (só com vetorizador estável: TF-IDF pré-treinado ou hashing)
+    PROFILE_CACHE_ENABLED: bool = True
+    # Embeddings do catálogo + índice LSH (`python -m app.embeddings build`);
+    # com o índice carregado, os candidatos vêm do catálogo local e as APIs
+    # externas só são consultadas quando ele não devolve nada
+    EMBEDDINGS_DIR: str | None = "models/embeddings"
+    EMBEDDING_DIM: int = 128
+    ANN_TABLES: int = 8
+    # Bits por tabela: ~log2(livros / 50), ex.: 14 para ~1M de livros
+    ANN_BITS: int = 14
+    # Candidatos reordenados pelo scoring completo
+    ANN_CANDIDATES: int = 200
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -0,0 +1,376 @@
+"""
+Embeddings do catálogo e índice de vizinhos aproximados (LSH)
+
+Uso:
+    python -m app.embeddings build --dim 128 --tables 8 --bits 14
+
+O job offline vetoriza o catálogo com o vetorizador das recomendações
+(TF-IDF pré-treinado ou hashing), reduz cada vetor para `dim` dimensões com
+uma SVD truncada (LSA) ajustada numa amostra do catálogo e grava em
+`settings.EMBEDDINGS_DIR`:
+
+- embeddings.npy: matriz float32 com linhas normalizadas (aberta com mmap)
+- ids.npy: id do livro de cada linha
+- index.npz: hiperplanos e códigos ordenados de cada tabela do LSH
+- svd.joblib: a redução, usada também nas consultas
+- meta.json: formato, data e assinatura do vetorizador
+
+Na recomendação, cada favorito do perfil de gosto vira uma consulta: cada
+tabela devolve os livros do mesmo bucket e dos buckets a um bit de
+distância, e os candidatos são reordenados pelo produto escalar exato.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import featurizers
+from .catalog import row_to_book
+from .config import settings
+from .database import SessionLocal
+from .models import Book
+from .profiles import TasteProfile
+
+
+# Incrementar quando os arquivos gravados mudarem de forma incompatível
+FORMAT_VERSION = 1
+
+
+class CatalogIndex:
+    """Embeddings do catálogo + tabelas LSH de hiperplanos aleatórios"""
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        ids: np.ndarray,
+        planes: np.ndarray,
+        sorted_codes: np.ndarray,
+        order: np.ndarray,
+        svd: TruncatedSVD,
+        meta: Dict
+    ):
+        self.embeddings = embeddings
+        self.ids = ids
+        self.planes = planes
+        self.sorted_codes = sorted_codes
+        self.order = order
+        self.svd = svd
+        self.meta = meta
+        self.bit_values = np.left_shift(np.uint32(1), np.arange(planes.shape[1], dtype=np.uint32))
+        self.queries = 0
+        self.total_ms = 0.0
+
+    def codes(self, vectors: np.ndarray) -> np.ndarray:
+        """Código LSH de cada vetor em cada tabela: (tabelas, vetores)"""
+        bits = np.einsum('tbd,nd->tnb', self.planes, vectors) > 0
+        return (bits * self.bit_values).sum(axis=2, dtype=np.uint32)
+
+    def project(self, vectors: sp.spmatrix) -> np.ndarray:
+        """Vetores do vetorizador -> embeddings normalizados"""
+        return normalize(self.svd.transform(vectors).astype(np.float32))
+
+    def search(self, queries: np.ndarray, k: int, exclude: Set[str] = frozenset()) -> List[Tuple[str, float]]:
+        """
+        Vizinhos aproximados de um conjunto de consultas
+
+        Args:
+            queries: Embeddings normalizados (uma linha por consulta)
+            k: Número de livros a devolver
+            exclude: Ids que não podem ser devolvidos
+
+        Returns:
+            [(id, similaridade)] da maior para a menor similaridade com
+            qualquer uma das consultas
+        """
+        started = time.perf_counter()
+        codes = self.codes(queries)
+        # Multi-probe: o bucket da consulta e os vizinhos a um bit de distância
+        probes = np.concatenate([codes[:, :, None], codes[:, :, None] ^ self.bit_values], axis=2)
+
+        rows = []
+        for table in range(self.planes.shape[0]):
+            table_probes = np.unique(probes[table])
+            lo = np.searchsorted(self.sorted_codes[table], table_probes, side='left')
+            hi = np.searchsorted(self.sorted_codes[table], table_probes, side='right')
+            rows.extend(self.order[table][a:b] for a, b in zip(lo, hi) if b > a)
+        if not rows:
+            return []
+
+        rows = np.unique(np.concatenate(rows))
+        similarity = (self.embeddings[rows] @ queries.T).max(axis=1)
+        if exclude:
+            keep = ~np.isin(self.ids[rows], list(exclude))
+            rows, similarity = rows[keep], similarity[keep]
+        if len(rows) > k:
+            best = np.argpartition(-similarity, k - 1)[:k]
+            rows, similarity = rows[best], similarity[best]
+        ranking = np.argsort(-similarity, kind='stable')
+
+        self.queries += 1
+        self.total_ms += (time.perf_counter() - started) * 1000
+        return [(str(self.ids[rows[i]]), float(similarity[i])) for i in ranking]
+
+    def stats(self) -> Dict:
+        return {
+            'version': self.meta['version'],
+            'books': int(len(self.ids)),
+            'dim': int(self.embeddings.shape[1]),
+            'tables': int(self.planes.shape[0]),
+            'bits': int(self.planes.shape[1]),
+            'queries': self.queries,
+            'avg_ms': round(self.total_ms / self.queries, 2) if self.queries else 0.0
+        }
+
+
+# Índice carregado (None = não carregado ou indisponível)
+_index: Optional[CatalogIndex] = None
+_loaded = False
+
+
+def build(
+    directory: str,
+    dim: int = 128,
+    tables: int = 8,
+    bits: int = 14,
+    limit: Optional[int] = None,
+    fit_sample: int = 20000,
+    batch_size: int = 5000,
+    seed: int = 0
+) -> Dict:
+    """
+    Vetorizar o catálogo, montar o índice LSH e gravar tudo em `directory`
+
+    Args:
+        directory: Pasta de saída (os arquivos são substituídos)
+        dim: Dimensões dos embeddings
+        tables: Tabelas de hash do LSH (mais tabelas, mais recall)
+        bits: Hiperplanos por tabela (mais bits, buckets menores)
+        limit: Usar só os N primeiros livros do catálogo
+        fit_sample: Livros usados para ajustar a SVD (espalhados pelo catálogo)
+        seed: Semente da SVD e dos hiperplanos
+
+    Returns:
+        Metadados gravados em meta.json
+    """
+    vectorizer = featurizers.get_vectorizer()
+    signature = featurizers.signature()
+    if vectorizer is None:
+        raise SystemExit(
+            "Sem vetorizador estável: rode `python -m app.featurizers fit` "
+            "ou use RECOMMENDATION_FEATURIZER=hashing"
+        )
+    if bits > 32:
+        raise SystemExit("--bits deve ser no máximo 32")
+
+    db = SessionLocal()
+    try:
+        total = db.query(func.count(Book.id)).scalar()
+    finally:
+        db.close()
+    if limit:
+        total = min(total, limit)
+
+    os.makedirs(directory, exist_ok=True)
+    started = time.monotonic()
+
+    # A SVD é ajustada numa amostra e aplicada ao catálogo inteiro em lotes.
+    # O catálogo vem ordenado por id (todos os gb_* antes dos ol_*), então a
+    # amostra pega um a cada `step` livros em vez dos primeiros
+    step = max(1, math.ceil(total / fit_sample))
+    sample = [
+        text for _, text in itertools.islice(
+            featurizers.iter_catalog(batch_size=batch_size, limit=total), 0, None, step
+        )
+    ]
+    if len(sample) <= dim:
+        raise SystemExit(f"Catálogo pequeno demais para {dim} dimensões ({len(sample)} livros)")
+    svd = TruncatedSVD(n_components=dim, random_state=seed)
+    svd.fit(vectorizer.transform(sample))
+    del sample
+
+    embeddings_path = os.path.join(directory, 'embeddings.npy')
+    embeddings = np.lib.format.open_memmap(
+        f"{embeddings_path}.tmp", mode='w+', dtype=np.float32, shape=(total, dim)
+    )
+    ids: List[str] = []
+    batch_ids: List[str] = []
+    batch_texts: List[str] = []
+
+    def flush():
+        start = len(ids)
+        vectors = normalize(svd.transform(vectorizer.transform(batch_texts)).astype(np.float32))
+        embeddings[start:start + len(batch_ids)] = vectors
+        ids.extend(batch_ids)
+        batch_ids.clear()
+        batch_texts.clear()
+
+    for book_id, text in featurizers.iter_catalog(batch_size=batch_size, limit=total):
+        batch_ids.append(book_id)
+        batch_texts.append(text)
+        if len(batch_ids) >= batch_size:
+            flush()
+            print(f"{len(ids):,}/{total:,} livros vetorizados")
+    if batch_ids:
+        flush()
+    embeddings.flush()
+    del embeddings
+    embeddings = np.load(f"{embeddings_path}.tmp", mmap_mode='r')[:len(ids)]
+
+    # LSH: cada tabela ordena os livros pelo código, para buscar por searchsorted
+    planes = np.random.default_rng(seed).standard_normal((tables, bits, dim)).astype(np.float32)
+    index = CatalogIndex(embeddings, np.array(ids), planes, None, None, svd, {})
+    codes = np.empty((tables, len(ids)), dtype=np.uint32)
+    for start in range(0, len(ids), batch_size):
+        codes[:, start:start + batch_size] = index.codes(np.asarray(embeddings[start:start + batch_size]))
+    order = np.argsort(codes, axis=1, kind='stable').astype(np.int64)
+    sorted_codes = np.take_along_axis(codes, order, axis=1)
+
+    meta = {
+        'format': FORMAT_VERSION,
+        'version': datetime.utcnow().strftime('%Y%m%d%H%M%S'),
+        'signature': signature,
+        'books': len(ids),
+        'dim': dim,
+        'tables': tables,
+        'bits': bits
+    }
+    if len(ids) < total:
+        np.save(embeddings_path, np.asarray(embeddings))
+        os.remove(f"{embeddings_path}.tmp")
+    else:
+        del embeddings, index
+        os.replace(f"{embeddings_path}.tmp", embeddings_path)
+    np.save(os.path.join(directory, 'ids.npy'), np.array(ids))
+    np.savez(os.path.join(directory, 'index.npz'), planes=planes, sorted_codes=sorted_codes, order=order)
+    joblib.dump(svd, os.path.join(directory, 'svd.joblib'))
+    # meta.json por último: sem ele (ou com outro formato) o índice não é carregado
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    print(f"Índice {meta['version']}: {len(ids):,} livros, {dim} dimensões, "
+          f"{tables} tabelas x {bits} bits ({time.monotonic() - started:.0f}s) -> {directory}")
+    return meta
+
+
+def load(directory: Optional[str] = None) -> Optional[CatalogIndex]:
+    """
+    Carregar o índice (chamado no startup, depois do vetorizador)
+
+    Returns:
+        O índice, ou None se não existir ou não combinar com o vetorizador atual
+    """
+    global _index, _loaded
+    directory = directory or settings.EMBEDDINGS_DIR
+    _loaded = True
+    _index = None
+    meta_path = os.path.join(directory, 'meta.json') if directory else None
+    if not meta_path or not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('format') != FORMAT_VERSION:
+            print(f"⚠️ AVISO: índice do catálogo em {directory} tem formato {meta.get('format')}; "
+                  f"esperado {FORMAT_VERSION}. Rode `python -m app.embeddings build`")
+            return None
+        if meta.get('signature') != featurizers.signature():
+            print(f"⚠️ AVISO: índice do catálogo em {directory} foi gerado com outro "
+                  f"vetorizador ({meta.get('signature')}). Rode `python -m app.embeddings build`")
+            return None
+        index = np.load(os.path.join(directory, 'index.npz'))
+        _index = CatalogIndex(
+            embeddings=np.load(os.path.join(directory, 'embeddings.npy'), mmap_mode='r'),
+            ids=np.load(os.path.join(directory, 'ids.npy')),
+            planes=index['planes'],
+            sorted_codes=index['sorted_codes'],
+            order=index['order'],
+            svd=joblib.load(os.path.join(directory, 'svd.joblib')),
+            meta=meta
+        )
+    except Exception as e:
+        print(f"⚠️ AVISO: não foi possível carregar o índice do catálogo ({e})")
+        _index = None
+    return _index
+
+
+def get_index() -> Optional[CatalogIndex]:
+    if not _loaded:
+        load()
+    return _index
+
+
+def stats() -> Dict:
+    index = get_index() if _loaded else _index
+    return index.stats() if index else {'loaded': False}
+
+
+def recommend_candidates(
+    db: Session,
+    profile: TasteProfile,
+    k: int,
+    exclude: Iterable[str] = ()
+) -> List[Dict]:
+    """
+    Candidatos do catálogo mais próximos dos favoritos do perfil
+
+    Returns:
+        Livros no formato padrão, do mais ao menos parecido ([] sem índice)
+    """
+    index = get_index()
+    favorites = profile.favorite_vectors()
+    if index is None or favorites is None:
+        return []
+
+    results = index.search(index.project(favorites), k, exclude=set(exclude))
+    if not results:
+        return []
+    ids = [book_id for book_id, _ in results]
+    rows = {row.id: row for row in db.query(Book).filter(Book.id.in_(ids))}
+    return [row_to_book(rows[book_id]) for book_id in ids if book_id in rows]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Embeddings do catálogo e índice de vizinhos aproximados"
+    )
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_parser = sub.add_parser('build', help="Vetorizar o catálogo e montar o índice")
+    build_parser.add_argument('--output', default=settings.EMBEDDINGS_DIR)
+    build_parser.add_argument('--dim', type=int, default=settings.EMBEDDING_DIM)
+    build_parser.add_argument('--tables', type=int, default=settings.ANN_TABLES)
+    build_parser.add_argument('--bits', type=int, default=settings.ANN_BITS)
+    build_parser.add_argument('--batch-size', type=int, default=5000)
+    build_parser.add_argument('--limit', type=int, help="Usar só os N primeiros livros")
+    build_parser.add_argument('--fit-sample', type=int, default=20000,
+                              help="Livros usados para ajustar a SVD")
+    args = parser.parse_args(argv)
+
+    if not args.output:
+        parser.error("defina EMBEDDINGS_DIR ou use --output")
+    build(
+        args.output,
+        dim=args.dim,
+        tables=args.tables,
+        bits=args.bits,
+        limit=args.limit,
+        fit_sample=args.fit_sample,
+        batch_size=args.batch_size
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
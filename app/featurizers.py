@@ -0,0 +1,396 @@
+"""
+Vetorizadores de texto das recomendações
+
+Dois modos, escolhidos em `settings.RECOMMENDATION_FEATURIZER`:
+
+- "tfidf": TF-IDF treinado offline no catálogo local. O modelo é gravado em
+  `settings.TFIDF_MODEL_PATH` (joblib) com a versão do formato, a data do
+  treino e a versão do scikit-learn. Sem modelo (ou com um modelo
+  incompatível), as recomendações voltam a treinar o TF-IDF a cada
+  requisição.
+- "hashing": HashingVectorizer (sem vocabulário, nada a treinar) com uma
+  tabela de IDF pré-calculada em `settings.HASHING_IDF_PATH`. Os vetores
+  são os mesmos em qualquer processo; sem a tabela, usa só a frequência.
+
+Uso:
+    python -m app.featurizers fit --max-features 20000
+    python -m app.featurizers idf
+    python -m app.featurizers bench --runs 50
+
+A aplicação carrega o modo configurado uma vez e, nas requisições, só
+chama `transform`.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import sklearn
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+from .config import settings
+from .database import SessionLocal
+from .models import Book
+
+
+# Incrementar quando o conteúdo do arquivo mudar de forma incompatível
+FORMAT_VERSION = 1
+
+# Modelo carregado (None = não carregado ou indisponível)
+_model: Optional[Dict] = None
+_loaded = False
+
+# Mesma análise de texto do TF-IDF, para os dois modos serem comparáveis
+HASHING_PARAMS = {
+    'stop_words': 'english',
+    'ngram_range': (1, 2),
+    'alternate_sign': False,
+    'norm': None,
+    'dtype': np.float32,
+}
+
+
+class HashingFeaturizer:
+    """
+    TF-IDF sem vocabulário: termos -> colunas por hash, pesos de uma tabela
+    de IDF fixa e normalização L2 (como o TfidfVectorizer)
+    """
+
+    def __init__(self, n_features: int, idf: Optional[np.ndarray] = None):
+        self.hasher = HashingVectorizer(n_features=n_features, **HASHING_PARAMS)
+        self.idf = sp.diags(idf.astype(np.float32)) if idf is not None else None
+
+    def transform(self, texts: List[str]) -> sp.csr_matrix:
+        vectors = self.hasher.transform(texts)
+        if self.idf is not None:
+            vectors = vectors @ self.idf
+        return normalize(vectors, copy=False)
+
+
+def fit_request_vectorizer(corpus: List[str]) -> TfidfVectorizer:
+    """TF-IDF treinado na própria requisição (comportamento sem modelo pré-treinado)"""
+    vectorizer = TfidfVectorizer(
+        max_features=1500, # Aumentei um pouco para captar mais nuances
+        stop_words='english', # Idealmente, use stop_words em português se os livros forem BR
+        ngram_range=(1, 2)
+    )
+    return vectorizer.fit(corpus)
+
+
+def document_text(description: Optional[str], title: Optional[str]) -> str:
+    """Texto usado no TF-IDF: a descrição, ou o título se não houver descrição"""
+    text = description or title or ""
+    return text if text.strip() else "no description"
+
+
+def iter_catalog(batch_size: int = 5000, limit: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+    """Percorrer (id, texto) do catálogo em lotes (paginação por id)"""
+    db = SessionLocal()
+    try:
+        last_id = ''
+        count = 0
+        while True:
+            rows = db.query(Book.id, Book.description, Book.title).filter(
+                Book.id > last_id
+            ).order_by(Book.id).limit(batch_size).all()
+            if not rows:
+                return
+            for row in rows:
+                yield row.id, document_text(row.description, row.title)
+                count += 1
+                if limit and count >= limit:
+                    return
+            last_id = rows[-1].id
+    finally:
+        db.close()
+
+
+def iter_catalog_documents(batch_size: int = 5000, limit: Optional[int] = None) -> Iterator[str]:
+    """Percorrer os textos do catálogo em lotes"""
+    for _, text in iter_catalog(batch_size, limit):
+        yield text
+
+
+def fit(
+    path: str,
+    max_features: int = 20000,
+    min_df: int = 2,
+    limit: Optional[int] = None
+) -> Dict:
+    """
+    Treinar o TF-IDF no catálogo e gravar em disco
+
+    Args:
+        path: Arquivo de saída (substituído de forma atômica)
+        max_features: Tamanho máximo do vocabulário
+        min_df: Frequência mínima de documentos de um termo
+        limit: Usar só os N primeiros livros do catálogo
+
+    Returns:
+        Metadados do modelo gravado
+    """
+    documents = 0
+
+    def counted():
+        nonlocal documents
+        for doc in iter_catalog_documents(limit=limit):
+            documents += 1
+            yield doc
+
+    vectorizer = TfidfVectorizer(
+        max_features=max_features,
+        min_df=min_df,
+        stop_words='english',
+        ngram_range=(1, 2),
+        dtype=np.float32
+    )
+    started = time.monotonic()
+    vectorizer.fit(counted())
+
+    model = {
+        'format': FORMAT_VERSION,
+        'version': datetime.utcnow().strftime('%Y%m%d%H%M%S'),
+        'sklearn': sklearn.__version__,
+        'documents': documents,
+        'features': len(vectorizer.vocabulary_),
+        'vectorizer': vectorizer
+    }
+    _dump(model, path)
+
+    print(f"TF-IDF {model['version']}: {documents:,} documentos, "
+          f"{model['features']:,} termos ({time.monotonic() - started:.0f}s) -> {path}")
+    return model
+
+
+def fit_idf(path: str, n_features: int, limit: Optional[int] = None, batch_size: int = 5000) -> Dict:
+    """
+    Calcular a tabela de IDF do modo hashing sobre o catálogo e gravar em disco
+
+    Usa a mesma fórmula do TfidfVectorizer (smooth_idf): ln((1 + n) / (1 + df)) + 1
+
+    Args:
+        path: Arquivo de saída (substituído de forma atômica)
+        n_features: Colunas do hash (deve ser igual a HASHING_N_FEATURES)
+        limit: Usar só os N primeiros livros do catálogo
+
+    Returns:
+        Metadados da tabela gravada
+    """
+    hasher = HashingVectorizer(n_features=n_features, binary=True, **HASHING_PARAMS)
+    df = np.zeros(n_features, dtype=np.int64)
+    documents = 0
+    batch: List[str] = []
+    started = time.monotonic()
+
+    def flush():
+        df[:] += np.asarray((hasher.transform(batch) > 0).sum(axis=0)).ravel()
+
+    for doc in iter_catalog_documents(limit=limit):
+        batch.append(doc)
+        documents += 1
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+    if batch:
+        flush()
+
+    table = {
+        'format': FORMAT_VERSION,
+        'version': datetime.utcnow().strftime('%Y%m%d%H%M%S'),
+        'documents': documents,
+        'n_features': n_features,
+        'idf': (np.log((1 + documents) / (1 + df)) + 1).astype(np.float32)
+    }
+    _dump(table, path)
+    print(f"IDF {table['version']}: {documents:,} documentos, "
+          f"{int((df > 0).sum()):,} colunas usadas ({time.monotonic() - started:.0f}s) -> {path}")
+    return table
+
+
+def _dump(payload: Dict, path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    joblib.dump(payload, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _load_file(path: Optional[str], label: str) -> Optional[Dict]:
+    """Ler um arquivo joblib deste módulo; None se ausente ou incompatível"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        payload = joblib.load(path)
+    except Exception as e:
+        print(f"⚠️ AVISO: não foi possível carregar o {label} de {path} ({e})")
+        return None
+    if payload.get('format') != FORMAT_VERSION:
+        print(f"⚠️ AVISO: {label} em {path} tem formato {payload.get('format')}; "
+              f"esperado {FORMAT_VERSION}. Gere o arquivo de novo com `python -m app.featurizers`")
+        return None
+    return payload
+
+
+def load_tfidf(path: Optional[str] = None) -> Optional[Dict]:
+    """TF-IDF pré-treinado, ou None"""
+    model = _load_file(path or settings.TFIDF_MODEL_PATH, 'TF-IDF')
+    if model and model.get('sklearn') != sklearn.__version__:
+        print(f"⚠️ AVISO: TF-IDF treinado com scikit-learn {model.get('sklearn')} "
+              f"(instalado: {sklearn.__version__})")
+    return model
+
+
+def load_hashing(path: Optional[str] = None, n_features: Optional[int] = None) -> Dict:
+    """Featurizer de hashing, com a tabela de IDF se houver uma compatível"""
+    n_features = n_features or settings.HASHING_N_FEATURES
+    table = _load_file(path or settings.HASHING_IDF_PATH, 'IDF')
+    if table and table['n_features'] != n_features:
+        print(f"⚠️ AVISO: tabela de IDF tem {table['n_features']} colunas "
+              f"(HASHING_N_FEATURES={n_features}); usando só a frequência")
+        table = None
+    return {
+        'version': table['version'] if table else None,
+        'documents': table['documents'] if table else 0,
+        'features': n_features,
+        'vectorizer': HashingFeaturizer(n_features, table['idf'] if table else None)
+    }
+
+
+def load() -> Optional[Dict]:
+    """
+    Carregar o vetorizador do modo configurado (chamado no startup)
+
+    Returns:
+        O modelo, ou None para treinar o TF-IDF a cada requisição
+    """
+    global _model, _loaded
+    _loaded = True
+    if settings.RECOMMENDATION_FEATURIZER == 'hashing':
+        _model = load_hashing()
+    else:
+        _model = load_tfidf()
+    return _model
+
+
+def get_vectorizer():
+    """Vetorizador do modo configurado (com `transform`), ou None para treinar por requisição"""
+    if not _loaded:
+        load()
+    return _model['vectorizer'] if _model else None
+
+
+def signature() -> Optional[str]:
+    """Identificação do vetorizador carregado (None = treino por requisição)"""
+    if get_vectorizer() is None:
+        return None
+    return f"{settings.RECOMMENDATION_FEATURIZER}:{_model['version']}:{_model['features']}"
+
+
+def stats() -> Dict:
+    if not _model:
+        return {'mode': settings.RECOMMENDATION_FEATURIZER, 'loaded': False}
+    return {
+        'mode': settings.RECOMMENDATION_FEATURIZER,
+        'loaded': True,
+        'version': _model['version'],
+        'documents': _model['documents'],
+        'features': _model['features']
+    }
+
+
+def _semantic_scores(vectorizer, favorites: List[str], candidates: List[str]) -> np.ndarray:
+    """Mesma similaridade de generate_recommendations (média dos 3 melhores)"""
+    sim = cosine_similarity(vectorizer.transform(candidates), vectorizer.transform(favorites))
+    if sim.shape[1] >= 3:
+        return np.sort(sim, axis=1)[:, -3:].mean(axis=1)
+    return sim.mean(axis=1)
+
+
+def bench(runs: int = 50, favorites: int = 5, candidates: int = 100, top: int = 12, seed: int = 0) -> None:
+    """
+    Comparar latência e qualidade dos modos com livros sorteados do catálogo
+
+    A referência de qualidade é o TF-IDF treinado por requisição (o
+    comportamento original): para cada modo, mede a sobreposição do top-N
+    de candidatos e a correlação dos scores com a referência.
+    """
+    rng = np.random.default_rng(seed)
+    documents = list(iter_catalog_documents(limit=max(5000, favorites + candidates)))
+    if len(documents) < favorites + candidates:
+        print(f"Catálogo pequeno demais: {len(documents)} livros")
+        return
+
+    modes = {'tfidf (por requisição)': None}
+    tfidf = load_tfidf()
+    if tfidf:
+        modes[f"tfidf pré-treinado ({tfidf['version']})"] = tfidf['vectorizer']
+    hashing = load_hashing()
+    modes[f"hashing (idf {hashing['version'] or 'ausente'})"] = hashing['vectorizer']
+
+    timings = {name: [] for name in modes}
+    overlap = {name: [] for name in modes}
+    correlation = {name: [] for name in modes}
+    for _ in range(runs):
+        sample = rng.choice(len(documents), favorites + candidates, replace=False)
+        fav = [documents[i] for i in sample[:favorites]]
+        cand = [documents[i] for i in sample[favorites:]]
+        reference = None
+        for name, vectorizer in modes.items():
+            started = time.perf_counter()
+            scores = _semantic_scores(vectorizer or fit_request_vectorizer(fav + cand), fav, cand)
+            timings[name].append(time.perf_counter() - started)
+            if reference is None:
+                reference = scores
+            ref_top = set(np.argsort(-reference, kind='stable')[:top])
+            overlap[name].append(len(ref_top & set(np.argsort(-scores, kind='stable')[:top])) / top)
+            if np.std(scores) > 0 and np.std(reference) > 0:
+                correlation[name].append(float(np.corrcoef(scores, reference)[0, 1]))
+
+    print(f"{runs} rodadas, {favorites} favoritos x {candidates} candidatos, top {top}")
+    print(f"{'modo':<40} {'p50 ms':>8} {'p95 ms':>8} {'top-N':>7} {'corr':>6}")
+    for name in modes:
+        ms = np.array(timings[name]) * 1000
+        corr = np.mean(correlation[name]) if correlation[name] else float('nan')
+        print(f"{name:<40} {np.percentile(ms, 50):>8.2f} {np.percentile(ms, 95):>8.2f} "
+              f"{np.mean(overlap[name]):>7.2f} {corr:>6.2f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Vetorizadores das recomendações: treino, IDF e benchmark"
+    )
+    sub = parser.add_subparsers(dest='command', required=True)
+    fit_parser = sub.add_parser('fit', help="Treinar e gravar o TF-IDF")
+    fit_parser.add_argument('--output', default=settings.TFIDF_MODEL_PATH)
+    fit_parser.add_argument('--max-features', type=int, default=20000)
+    fit_parser.add_argument('--min-df', type=int, default=2)
+    fit_parser.add_argument('--limit', type=int, help="Usar só os N primeiros livros")
+    idf_parser = sub.add_parser('idf', help="Calcular e gravar a tabela de IDF do modo hashing")
+    idf_parser.add_argument('--output', default=settings.HASHING_IDF_PATH)
+    idf_parser.add_argument('--n-features', type=int, default=settings.HASHING_N_FEATURES)
+    idf_parser.add_argument('--limit', type=int, help="Usar só os N primeiros livros")
+    bench_parser = sub.add_parser('bench', help="Comparar latência e qualidade dos modos")
+    bench_parser.add_argument('--runs', type=int, default=50)
+    bench_parser.add_argument('--favorites', type=int, default=5)
+    bench_parser.add_argument('--candidates', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    if args.command in ('fit', 'idf') and not args.output:
+        parser.error("defina o caminho nas configurações ou use --output")
+    if args.command == 'fit':
+        fit(args.output, max_features=args.max_features, min_df=args.min_df, limit=args.limit)
+    elif args.command == 'idf':
+        fit_idf(args.output, n_features=args.n_features, limit=args.limit)
+    else:
+        bench(runs=args.runs, favorites=args.favorites, candidates=args.candidates)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
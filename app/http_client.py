@@ -0,0 +1,116 @@
+"""
+Cliente HTTP assíncrono compartilhado pelas fontes de livros.
+
+Um único httpx.AsyncClient (pool de conexões keep-alive) é aberto no
+startup da aplicação e fechado no shutdown, evitando um handshake TCP+TLS
+por chamada e o bloqueio do event loop.
+"""
+import asyncio
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from .config import settings
+
+
+_client: Optional[httpx.AsyncClient] = None
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def _http2_available() -> bool:
+    """HTTP/2 exige o pacote opcional `h2` (httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _build_client() -> httpx.AsyncClient:
+    """Criar o cliente com limites e timeouts vindos do Settings"""
+    http2 = settings.HTTP2_ENABLED and _http2_available()
+    if settings.HTTP2_ENABLED and not http2:
+        print("⚠️ AVISO: HTTP2_ENABLED ativo, mas o pacote 'h2' não está instalado")
+
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(
+            settings.HTTP_TIMEOUT,
+            connect=settings.HTTP_CONNECT_TIMEOUT
+        ),
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        ),
+        headers={"User-Agent": "BookBrain (+https://github.com/jotamath/bookbrain)"}
+    )
+
+
+async def startup_http_client() -> None:
+    """Abrir o pool de conexões (chamado no lifespan da aplicação)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+
+
+async def shutdown_http_client() -> None:
+    """Fechar o pool de conexões (chamado no lifespan da aplicação)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _host_semaphores.clear()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Retorna o cliente compartilhado.
+
+    Fora do lifespan (scripts, shell) o cliente é criado sob demanda.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    """Semáforo que limita as conexões simultâneas por host"""
+    host = urlsplit(url).netloc
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(settings.HTTP_MAX_CONNECTIONS_PER_HOST)
+        _host_semaphores[host] = semaphore
+    return semaphore
+
+
+async def http_get(
+    url: str,
+    params: Optional[Dict] = None,
+    timeout: Optional[float] = None
+) -> httpx.Response:
+    """
+    GET pelo pool compartilhado, respeitando o limite por host
+
+    Args:
+        url: URL absoluta
+        params: Query string
+        timeout: Sobrescreve o timeout padrão (segundos)
+
+    Returns:
+        Resposta já validada com raise_for_status()
+    """
+    client = get_http_client()
+    kwargs = {"params": params}
+    if timeout is not None:
+        kwargs["timeout"] = httpx.Timeout(
+            timeout,
+            connect=min(timeout, settings.HTTP_CONNECT_TIMEOUT)
+        )
+
+    async with _host_semaphore(url):
+        response = await client.get(url, **kwargs)
+    response.raise_for_status()
+    return response
@@ -0,0 +1,236 @@
+"""
+Importação em massa dos dumps da Open Library para o catálogo local
+https://openlibrary.org/developers/dumps
+
+Uso:
+    python -m app.ingest ol_dump_works_latest.txt.gz \\
+        --authors ol_dump_authors_latest.txt.gz --batch-size 2000
+
+Os arquivos são lidos em streaming (gzip ou texto puro, no formato TSV
+oficial `type  key  revision  last_modified  json` ou JSON lines), então o
+uso de memória não depende do tamanho do dump. Os nomes de autores ficam
+em um índice `dbm` temporário em disco.
+"""
+import argparse
+import dbm
+import gzip
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional
+
+from .book_apis import OpenLibraryAPI
+from .catalog import upsert_books
+from .database import Base, SessionLocal, engine
+from .migrations import run_migrations
+from .search_index import ensure_search_index
+
+
+YEAR_RE = re.compile(r'\b(\d{4})\b')
+
+
+def iter_records(path: str) -> Iterator[Dict]:
+    """
+    Ler registros de um dump da Open Library, um por vez
+
+    Args:
+        path: Arquivo .gz ou texto, em TSV oficial ou JSON lines
+
+    Returns:
+        Iterador de dicionários JSON (linhas inválidas são ignoradas)
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            # TSV oficial: o JSON é a 5ª coluna
+            payload = line if line.startswith('{') else line.split('\t', 4)[-1]
+            try:
+                yield json.loads(payload)
+            except ValueError:
+                continue
+
+
+def _text(value) -> str:
+    """Campos de texto podem vir como string ou {'type': ..., 'value': ...}"""
+    if isinstance(value, dict):
+        return value.get('value', '') or ''
+    return str(value) if value else ''
+
+
+def build_author_index(path: str, index_path: str) -> int:
+    """
+    Gravar {chave do autor: nome} em um índice dbm em disco
+
+    Returns:
+        Número de autores indexados
+    """
+    count = 0
+    with dbm.open(index_path, 'n') as index:
+        for record in iter_records(path):
+            key = record.get('key')
+            name = record.get('name') or record.get('personal_name')
+            if key and name:
+                index[key] = name
+                count += 1
+    return count
+
+
+def normalize_record(record: Dict, authors_index=None) -> Optional[Dict]:
+    """
+    Converter um work/edition do dump para o formato padrão de `_format_book`
+
+    Args:
+        record: Registro JSON do dump
+        authors_index: Índice dbm {chave do autor: nome} (opcional)
+
+    Returns:
+        Livro formatado ou None se o registro não tiver work/título
+    """
+    key = record.get('key', '')
+    if key.startswith('/books/'):
+        # Edition: o livro do catálogo é o work ao qual ela pertence
+        works = record.get('works') or []
+        key = works[0].get('key', '') if works else ''
+    if not key.startswith('/works/') or not record.get('title'):
+        return None
+
+    author_names = []
+    if authors_index is not None:
+        for entry in record.get('authors') or []:
+            if not isinstance(entry, dict):
+                continue
+            # works: {'author': {'key': ...}}; editions: {'key': ...}
+            author_key = (entry.get('author') or entry).get('key')
+            if author_key and author_key in authors_index:
+                author_names.append(authors_index[author_key].decode('utf-8'))
+
+    year_match = YEAR_RE.search(
+        _text(record.get('first_publish_date') or record.get('publish_date'))
+    )
+    covers = [c for c in record.get('covers') or [] if isinstance(c, int) and c > 0]
+
+    # Mesmo formato de documento da busca, para reaproveitar _format_book
+    doc = {
+        'key': key,
+        'title': record['title'],
+        'author_name': author_names,
+        'first_publish_year': int(year_match.group(1)) if year_match else '',
+        'subject': record.get('subjects') or [],
+        'cover_i': covers[0] if covers else None,
+    }
+    book = OpenLibraryAPI._format_book(doc)
+    if book is None:
+        return None
+
+    # Os dumps trazem a descrição completa, que a busca não devolve
+    description = _text(record.get('description'))
+    if description:
+        book['description'] = description
+    return book
+
+
+def ingest(
+    path: str,
+    authors_path: Optional[str] = None,
+    batch_size: int = 1000,
+    limit: Optional[int] = None,
+    update_existing: bool = True,
+    progress_every: int = 50_000
+) -> int:
+    """
+    Importar um dump para a tabela `books` em lotes
+
+    Args:
+        path: Dump de works ou editions
+        authors_path: Dump de autores, para resolver os nomes
+        batch_size: Livros por transação (gravados em comandos de até CHUNK_SIZE linhas)
+        limit: Parar após N livros (útil para benchmarks)
+        update_existing: Sobrescrever livros que já estão no catálogo
+        progress_every: Intervalo (em registros lidos) entre relatórios
+
+    Returns:
+        Número de livros gravados
+    """
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    ensure_search_index(engine)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        authors_index = None
+        if authors_path:
+            started = time.monotonic()
+            index_path = os.path.join(tmp, 'authors')
+            total_authors = build_author_index(authors_path, index_path)
+            print(f"Autores indexados: {total_authors:,} "
+                  f"({time.monotonic() - started:.0f}s)")
+            authors_index = dbm.open(index_path, 'r')
+
+        db = SessionLocal()
+        started = time.monotonic()
+        read = written = 0
+        batch: List[Dict] = []
+        try:
+            for record in iter_records(path):
+                read += 1
+                book = normalize_record(record, authors_index)
+                if book:
+                    batch.append(book)
+
+                if len(batch) >= batch_size:
+                    written += upsert_books(db, batch, update_existing=update_existing)
+                    batch = []
+
+                if read % progress_every == 0:
+                    elapsed = time.monotonic() - started
+                    print(f"{read:,} registros lidos, {written:,} livros gravados "
+                          f"({read / elapsed:,.0f} registros/s)")
+
+                if limit and written + len(batch) >= limit:
+                    break
+
+            if batch:
+                written += upsert_books(db, batch, update_existing=update_existing)
+        finally:
+            db.close()
+            if authors_index is not None:
+                authors_index.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Concluído: {read:,} registros lidos, {written:,} livros gravados "
+          f"em {elapsed:.0f}s")
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Importar dumps da Open Library para o catálogo local"
+    )
+    parser.add_argument('dump', help="Dump de works ou editions (.txt.gz ou JSON lines)")
+    parser.add_argument('--authors', help="Dump de autores, para resolver os nomes")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--limit', type=int, help="Parar após N livros")
+    parser.add_argument(
+        '--keep-existing',
+        action='store_true',
+        help="Não sobrescrever livros já presentes no catálogo"
+    )
+    args = parser.parse_args(argv)
+
+    ingest(
+        args.dump,
+        authors_path=args.authors,
+        batch_size=args.batch_size,
+        limit=args.limit,
+        update_existing=not args.keep_existing
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
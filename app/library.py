@@ -0,0 +1,200 @@
+"""
+Serviços da biblioteca do usuário
+"""
+import base64
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session, defer, joinedload
+
+from .config import settings
+from .database import dialect_insert
+from .models import Book, UserBook, UserStats
+
+
+# Status com contador próprio em user_stats
+STATUSES = ('want_to_read', 'reading', 'finished')
+
+
+class LibraryMembership:
+    """
+    Conjunto dos book_ids que estão na biblioteca de um usuário.
+
+    Substitui uma consulta (ou uma varredura linear) por livro por uma
+    única consulta IN e checagens O(1) em memória.
+    """
+
+    def __init__(self, book_ids: Iterable[str]):
+        self.book_ids = set(book_ids)
+
+    @classmethod
+    def for_books(cls, db: Session, user_id: int, book_ids: Iterable[str]) -> "LibraryMembership":
+        """Buscar, numa só consulta, quais desses livros o usuário já tem"""
+        book_ids = {book_id for book_id in book_ids if book_id}
+        if not book_ids:
+            return cls(())
+        rows = db.query(UserBook.book_id).filter(
+            UserBook.user_id == user_id,
+            UserBook.book_id.in_(book_ids)
+        )
+        return cls(row[0] for row in rows)
+
+    @classmethod
+    def from_user_books(cls, user_books: Iterable[UserBook]) -> "LibraryMembership":
+        """Montar a partir dos livros do usuário já carregados"""
+        return cls(b.book_id for b in user_books)
+
+    def __contains__(self, book_id: str) -> bool:
+        return book_id in self.book_ids
+
+    def annotate(self, books: List[Dict]) -> List[Dict]:
+        """Marcar `in_library` em cada livro (formato padrão das APIs)"""
+        for book in books:
+            book['in_library'] = book['id'] in self.book_ids
+        return books
+
+    def exclude(self, books: Iterable[Dict]) -> List[Dict]:
+        """Manter só os livros que ainda não estão na biblioteca"""
+        return [book for book in books if book['id'] not in self.book_ids]
+
+
+def encode_cursor(book: UserBook) -> str:
+    """Cursor opaco com a posição (added_at, id) do último livro da página"""
+    raw = f"{book.added_at.isoformat()}|{book.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    """Decodificar o cursor; None se for inválido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        added_at, book_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(added_at), int(book_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def get_library_page(
+    db: Session,
+    user_id: int,
+    status: str = 'all',
+    cursor: Optional[str] = None,
+    limit: int = 24
+) -> Tuple[List[UserBook], Optional[str]]:
+    """
+    Página da biblioteca por keyset (cursor), do mais recente ao mais antigo
+
+    Usa os índices (user_id, status, added_at, id) e (user_id, added_at, id):
+    cada página custa o mesmo, independentemente do tamanho da biblioteca.
+
+    Args:
+        db: Sessão do banco
+        user_id: Dono da biblioteca
+        status: Filtro de status ('all' para todos)
+        cursor: Cursor devolvido pela página anterior
+        limit: Livros por página
+
+    Returns:
+        (livros da página, cursor da próxima página ou None)
+    """
+    # Os cards usam só o trecho da descrição; os textos completos ficam
+    # para as recomendações
+    query = db.query(UserBook).options(
+        joinedload(UserBook.book).options(
+            defer(Book.description),
+            defer(Book.categories)
+        )
+    ).filter(UserBook.user_id == user_id)
+
+    if status != 'all':
+        query = query.filter(UserBook.status == status)
+
+    position = decode_cursor(cursor) if cursor else None
+    if position:
+        query = query.filter(tuple_(UserBook.added_at, UserBook.id) < tuple_(*position))
+
+    books = query.order_by(
+        UserBook.added_at.desc(),
+        UserBook.id.desc()
+    ).limit(limit + 1).all()
+
+    if len(books) > limit:
+        books = books[:limit]
+        return books, encode_cursor(books[-1])
+    return books, None
+
+
+def count_library(db: Session, user_id: int) -> Dict[str, int]:
+    """Contagem por status em uma única consulta GROUP BY"""
+    stats = {status: 0 for status in STATUSES}
+    stats['total'] = 0
+    rows = db.query(UserBook.status, func.count(UserBook.id)).filter(
+        UserBook.user_id == user_id
+    ).group_by(UserBook.status)
+    for status, count in rows:
+        if status in stats:
+            stats[status] = count
+        stats['total'] += count
+    return stats
+
+
+def get_library_stats(db: Session, user_id: int) -> Dict[str, int]:
+    """
+    Estatísticas da biblioteca do usuário
+
+    Com STATS_COUNTERS_ENABLED, lê a linha de user_stats (criada a partir do
+    GROUP BY na primeira visita); caso contrário, calcula com o GROUP BY.
+
+    Returns:
+        {'total', 'want_to_read', 'reading', 'finished'}
+    """
+    if not settings.STATS_COUNTERS_ENABLED:
+        return count_library(db, user_id)
+
+    row = db.get(UserStats, user_id)
+    if row is not None:
+        return {'total': row.total, **{status: getattr(row, status) for status in STATUSES}}
+
+    stats = count_library(db, user_id)
+    insert = dialect_insert(db)
+    db.execute(insert(UserStats).values(
+        user_id=user_id, **stats
+    ).on_conflict_do_nothing(index_elements=['user_id']))
+    db.commit()
+    return stats
+
+
+def adjust_library_stats(
+    db: Session,
+    user_id: int,
+    old_status: Optional[str],
+    new_status: Optional[str]
+) -> None:
+    """
+    Aplicar a mudança de um livro aos contadores, na transação corrente
+
+    Deve ser chamada antes do commit da própria escrita. Adição: old_status
+    None; remoção: new_status None. Sem linha em user_stats, não faz nada:
+    ela será montada pelo GROUP BY na próxima leitura.
+    """
+    if not settings.STATS_COUNTERS_ENABLED or old_status == new_status:
+        return
+
+    deltas = {}
+    if old_status is None:
+        deltas['total'] = 1
+    if new_status is None:
+        deltas['total'] = -1
+    if old_status in STATUSES:
+        deltas[old_status] = -1
+    if new_status in STATUSES:
+        deltas[new_status] = 1
+    if not deltas:
+        return
+
+    column = UserStats.__table__.c
+    db.query(UserStats).filter(UserStats.user_id == user_id).update(
+        {column[name]: column[name] + delta for name, delta in deltas.items()},
+        synchronize_session=False
+    )
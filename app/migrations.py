@@ -0,0 +1,169 @@
+"""
+Migrações idempotentes executadas no startup
+
+`Base.metadata.create_all` só cria tabelas novas; índices e colunas
+adicionados a tabelas existentes são aplicados aqui. Cada passo verifica
+o estado atual antes de agir, então pode rodar a cada inicialização.
+"""
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from .catalog import row_to_book, sync_book_links
+from .models import Book, UserBook
+
+
+def _index_names(conn: Connection, table: str) -> set:
+    return {index['name'] for index in inspect(conn).get_indexes(table)}
+
+
+def _column_names(conn: Connection, table: str) -> set:
+    return {column['name'] for column in inspect(conn).get_columns(table)}
+
+
+def unique_user_book_index(conn: Connection) -> None:
+    """Índice único (user_id, book_id), removendo duplicatas antigas"""
+    if 'uq_user_books_user_book' in _index_names(conn, 'user_books'):
+        return
+    # Mantém a primeira cópia de cada livro por usuário
+    conn.execute(text(
+        "DELETE FROM user_books WHERE id NOT IN ("
+        " SELECT MIN(id) FROM user_books GROUP BY user_id, book_id)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_user_books_user_book"
+        " ON user_books (user_id, book_id)"
+    ))
+
+
+def library_keyset_indexes(conn: Connection) -> None:
+    """Índices compostos da paginação por keyset da biblioteca"""
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_user_books_user_status_added"
+        " ON user_books (user_id, status, added_at, id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_user_books_user_added"
+        " ON user_books (user_id, added_at, id)"
+    ))
+
+
+# Mesmo corte de catalog.make_snippet
+_SNIPPET_SQL = (
+    "CASE WHEN length(description) > 150 THEN substr(description, 1, 150) || '...'"
+    " ELSE coalesce(description, '') END"
+)
+
+
+def description_snippet_column(conn: Connection) -> None:
+    """Coluna `description_snippet` do catálogo"""
+    if 'description_snippet' in _column_names(conn, 'books'):
+        return
+    conn.execute(text("ALTER TABLE books ADD COLUMN description_snippet VARCHAR(160)"))
+    conn.execute(text(f"UPDATE books SET description_snippet = {_SNIPPET_SQL}"))
+
+
+def normalize_user_books(conn: Connection) -> None:
+    """
+    Mover os dados dos livros de `user_books` para o catálogo `books`
+
+    Cada livro é copiado uma vez (da primeira cópia, sem sobrescrever o que
+    já estiver no catálogo) e `user_books` é recriada só com o estado do
+    usuário e a chave estrangeira para `books`.
+    """
+    if 'title' not in _column_names(conn, 'user_books'):
+        return
+
+    conn.execute(text(
+        "INSERT INTO books (id, title, authors, description, description_snippet,"
+        " categories, rating, thumbnail, source, updated_at)"
+        f" SELECT book_id, title, authors, description, {_SNIPPET_SQL},"
+        " categories, coalesce(google_rating, 0), thumbnail,"
+        " CASE substr(book_id, 1, 3) WHEN 'gb_' THEN 'google'"
+        " WHEN 'ol_' THEN 'openlibrary' ELSE '' END,"
+        " coalesce(added_at, CURRENT_TIMESTAMP)"
+        " FROM user_books"
+        " WHERE id IN (SELECT MIN(id) FROM user_books GROUP BY book_id)"
+        " ON CONFLICT (id) DO NOTHING"
+    ))
+
+    # Recriar a tabela (o SQLite não adiciona chave estrangeira com ALTER TABLE);
+    # os nomes de índice são globais, então os antigos saem antes
+    for index in _index_names(conn, 'user_books'):
+        conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+    conn.execute(text("ALTER TABLE user_books RENAME TO user_books_legacy"))
+    UserBook.__table__.create(conn)
+    conn.execute(text(
+        "INSERT INTO user_books (id, user_id, book_id, user_rating, status, added_at)"
+        " SELECT id, user_id, book_id, user_rating, status, added_at FROM user_books_legacy"
+    ))
+    conn.execute(text("DROP TABLE user_books_legacy"))
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('user_books', 'id'),"
+            " coalesce(max(id), 0) + 1, false) FROM user_books"
+        ))
+
+
+def book_author_category_links(conn: Connection, batch_size: int = 1000) -> None:
+    """Preencher autores, categorias e ligações a partir das colunas de texto de `books`"""
+    for table in ('book_authors', 'book_categories'):
+        if conn.execute(text(f"SELECT 1 FROM {table} LIMIT 1")).first():
+            return
+    db = Session(bind=conn)
+    last_id = ''
+    while True:
+        rows = db.query(Book).filter(Book.id > last_id).order_by(Book.id).limit(batch_size).all()
+        if not rows:
+            break
+        sync_book_links(db, [row_to_book(row) for row in rows])
+        last_id = rows[-1].id
+        db.expunge_all()
+
+
+def books_integer_key(conn: Connection) -> None:
+    """
+    Chave inteira `pk` em `books`
+
+    No SQLite a tabela é recriada com `pk INTEGER PRIMARY KEY` (alias do
+    rowid, que não muda num VACUUM) recebendo o rowid atual; o índice
+    full-text é descartado e reconstruído por `ensure_search_index`.
+    """
+    if 'pk' in _column_names(conn, 'books'):
+        return
+    if conn.dialect.name != 'sqlite':
+        conn.execute(text("ALTER TABLE books ADD COLUMN pk SERIAL"))
+        return
+
+    columns = ', '.join(c.name for c in Book.__table__.columns if c.name != 'pk')
+    # Os nomes de índice são globais, então os antigos saem antes
+    for index in _index_names(conn, 'books'):
+        conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+    books_new = Book.__table__.to_metadata(MetaData(), name='books_new')
+    books_new.indexes.clear()
+    books_new.create(conn)
+    conn.execute(text(
+        f"INSERT INTO books_new (pk, {columns}) SELECT rowid, {columns} FROM books"
+    ))
+    conn.execute(text("DROP TABLE books"))
+    conn.execute(text("ALTER TABLE books_new RENAME TO books"))
+    for index in Book.__table__.indexes:
+        index.create(conn)
+    conn.execute(text("DROP TABLE IF EXISTS books_fts"))
+
+
+MIGRATIONS = [
+    unique_user_book_index,
+    library_keyset_indexes,
+    description_snippet_column,
+    normalize_user_books,
+    book_author_category_links,
+    books_integer_key,
+]
+
+
+def run_migrations(engine: Engine) -> None:
+    """Aplicar todas as migrações pendentes"""
+    with engine.begin() as conn:
+        for migration in MIGRATIONS:
+            migration(conn)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index, Table, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -19,23 +19,153 @@ class User(Base):
         return f"<User {self.username}>"
 
 class UserBook(Base):
+    """Livro na biblioteca de um usuário: só o estado pessoal; os dados ficam em Book"""
     __tablename__ = "user_books"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    book_id = Column(String(100), nullable=False)  # Google Books ID
-    title = Column(String(500), nullable=False)
-    authors = Column(Text)  # Comma-separated
-    description = Column(Text)
-    categories = Column(Text)  # Comma-separated
-    thumbnail = Column(String(500))
-    google_rating = Column(Float, default=0.0)
+    book_id = Column(String(100), ForeignKey("books.id"), nullable=False)  # gb_<id> ou ol_<work>
     user_rating = Column(Integer)  # 1-5 stars
     status = Column(String(20), default="want_to_read")  # want_to_read, reading, finished
     added_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="books")
+    book = relationship("Book", lazy="joined", innerjoin=True)
+    
+    __table_args__ = (
+        # Um livro por usuário; serve também às buscas por user_id
+        Index("uq_user_books_user_book", "user_id", "book_id", unique=True),
+        # Paginação por keyset da biblioteca (com e sem filtro de status)
+        Index("ix_user_books_user_status_added", "user_id", "status", "added_at", "id"),
+        Index("ix_user_books_user_added", "user_id", "added_at", "id"),
+    )
+    
+    # Dados do livro compartilhado, com os nomes usados pelos templates e
+    # pelas recomendações
+    @property
+    def title(self):
+        return self.book.title
+    
+    @property
+    def authors(self):
+        return self.book.authors
+    
+    @property
+    def description(self):
+        return self.book.description
+    
+    @property
+    def description_snippet(self):
+        return self.book.description_snippet
+    
+    @property
+    def categories(self):
+        return self.book.categories
+    
+    @property
+    def thumbnail(self):
+        return self.book.thumbnail
+    
+    @property
+    def google_rating(self):
+        return self.book.rating or 0.0
     
     def __repr__(self):
-        return f"<UserBook {self.title}>"
\ No newline at end of file
+        return f"<UserBook {self.book_id}>"
+
+
+class UserStats(Base):
+    """Contadores desnormalizados da biblioteca (ver library.get_library_stats)"""
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    want_to_read = Column(Integer, nullable=False, default=0)
+    reading = Column(Integer, nullable=False, default=0)
+    finished = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<UserStats {self.user_id}>"
+
+
+class UserProfile(Base):
+    """Perfil de gosto serializado (ver app/profiles.py)"""
+    __tablename__ = "user_profiles"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(String(100), nullable=False)  # Vetorizador usado nos vetores
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<UserProfile {self.user_id}>"
+
+
+class Book(Base):
+    """Catálogo de livros compartilhado: resultados das APIs externas e livros das bibliotecas"""
+    __tablename__ = "books"
+
+    # Chave inteira: no SQLite é alias do rowid e identifica o livro no índice
+    # full-text (o rowid implícito de uma chave TEXT pode mudar num VACUUM)
+    pk = Column(Integer, primary_key=True)
+    id = Column(String(100), unique=True, nullable=False)  # gb_<id> ou ol_<work>
+    title = Column(String(500), nullable=False, index=True)
+    authors = Column(Text)  # Comma-separated
+    description = Column(Text)
+    description_snippet = Column(String(160))  # Início da descrição, para os cards
+    categories = Column(Text)  # Comma-separated
+    rating = Column(Float, default=0.0)
+    thumbnail = Column(String(500))
+    source = Column(String(20), nullable=False)  # google, openlibrary
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Para o ORM (e as chaves estrangeiras) o livro continua identificado por `id`
+    __mapper_args__ = {'primary_key': [id], 'exclude_properties': ['pk']}
+
+    def __repr__(self):
+        return f"<Book {self.title}>"
+
+
+class Author(Base):
+    """Autor normalizado; `name_key` é o nome em minúsculas, sem espaços nas pontas"""
+    __tablename__ = "authors"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=False)
+    name_key = Column(String(255), nullable=False, unique=True, index=True)
+
+    def __repr__(self):
+        return f"<Author {self.name}>"
+
+
+class Category(Base):
+    """Categoria normalizada; `name_key` é o nome em minúsculas, sem espaços nas pontas"""
+    __tablename__ = "categories"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(255), nullable=False)
+    name_key = Column(String(255), nullable=False, unique=True, index=True)
+
+    def __repr__(self):
+        return f"<Category {self.name}>"
+
+
+# Ligações livro <-> autor/categoria (as colunas de texto de Book continuam
+# sendo a fonte para exibição e para a busca full-text)
+book_authors = Table(
+    "book_authors",
+    Base.metadata,
+    Column("book_id", String(100), ForeignKey("books.id", ondelete="CASCADE"), primary_key=True),
+    Column("author_id", Integer, ForeignKey("authors.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_book_authors_author", "author_id"),
+)
+
+book_categories = Table(
+    "book_categories",
+    Base.metadata,
+    Column("book_id", String(100), ForeignKey("books.id", ondelete="CASCADE"), primary_key=True),
+    Column("category_id", Integer, ForeignKey("categories.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_book_categories_category", "category_id"),
+)
@@ -0,0 +1,320 @@
+"""
+Perfil de gosto por usuário, persistido e atualizado incrementalmente
+
+O perfil guarda o que as recomendações derivam da biblioteca:
+
+- vetores dos favoritos e dos livros odiados (no vetorizador configurado)
+- histogramas ponderados de categorias e autores (mesmos pesos de
+  `get_user_favorite_categories`/`get_user_favorite_authors`)
+- contagem de categorias e autores dos favoritos (para o match do scoring)
+
+Cada mudança na biblioteca (adicionar, avaliar, mudar status, remover)
+aplica só a diferença daquele livro. O perfil é montado do zero na primeira
+recomendação ou quando o vetorizador muda de versão; no modo de TF-IDF
+treinado por requisição não há vetores estáveis e o perfil não é usado.
+"""
+import pickle
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import scipy.sparse as sp
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import featurizers
+from .config import settings
+from .database import dialect_insert
+from .models import Author, Book, Category, UserBook, UserProfile, book_authors, book_categories
+
+
+# Incrementar quando o conteúdo serializado mudar
+PROFILE_FORMAT = 2
+
+# Estado de um livro na biblioteca: (user_rating, status); None = fora da biblioteca
+BookState = Optional[Tuple[Optional[int], Optional[str]]]
+
+
+def is_favorite(state: BookState) -> bool:
+    rating, status = state
+    return bool((rating and rating >= 3.5) or (status == "finished" and not rating))
+
+
+def is_hated(state: BookState) -> bool:
+    rating, _ = state
+    return bool(rating and rating <= 2.5)
+
+
+def category_weight(state: BookState) -> float:
+    """Peso de `get_user_favorite_categories`"""
+    rating, status = state
+    if rating:
+        if rating == 5: return 3.0
+        if rating == 4: return 2.0
+        if rating <= 2: return -1.0
+        return 1.0
+    if status == 'finished':
+        return 1.5
+    return 1.0
+
+
+def author_weight(state: BookState) -> float:
+    """Peso de `get_user_favorite_authors`"""
+    rating, _ = state
+    if rating:
+        if rating >= 4: return 3.0
+        if rating <= 2: return 0.0
+    return 1.0
+
+
+def links_by_book(db: Session, book_ids: Iterable[str]) -> Tuple[Dict[str, List[int]], Dict[str, List[int]]]:
+    """Ids de categorias e de autores de cada livro"""
+    book_ids = list(set(book_ids))
+    categories: Dict[str, List[int]] = {}
+    authors: Dict[str, List[int]] = {}
+    if not book_ids:
+        return categories, authors
+    for table, column, target in (
+        (book_categories, book_categories.c.category_id, categories),
+        (book_authors, book_authors.c.author_id, authors),
+    ):
+        rows = db.execute(select(table.c.book_id, column).where(table.c.book_id.in_(book_ids)))
+        for book_id, link_id in rows:
+            target.setdefault(book_id, []).append(link_id)
+    return categories, authors
+
+
+class TasteProfile:
+    """Perfil de gosto de um usuário (ver docstring do módulo)"""
+
+    def __init__(self, signature: str):
+        self.signature = signature
+        self.favorites: Dict[str, sp.csr_matrix] = {}
+        self.hated: Dict[str, sp.csr_matrix] = {}
+        # {id: [score, livros]}: o livro conta para a presença mesmo com peso 0
+        self.category_scores: Dict[int, List[float]] = {}
+        self.author_scores: Dict[int, List[float]] = {}
+        # {id: favoritos com a categoria/autor}
+        self.favorite_categories: Dict[int, int] = {}
+        self.favorite_authors: Dict[int, int] = {}
+        # {livro: (categorias, autores)} aplicados ao perfil: a remoção desfaz
+        # exatamente o que foi somado, mesmo que as ligações do catálogo mudem
+        self.links: Dict[str, Tuple[List[int], List[int]]] = {}
+
+    def apply(
+        self,
+        book_id: str,
+        before: BookState,
+        after: BookState,
+        category_ids: List[int],
+        author_ids: List[int],
+        vector: Callable[[], sp.csr_matrix]
+    ) -> None:
+        """
+        Trocar a contribuição de um livro (estado `before`) pela nova (`after`)
+
+        `category_ids`/`author_ids` são as ligações atuais do livro; a parte de
+        `before` é desfeita com as ligações gravadas quando ele foi aplicado.
+        """
+        applied = self.links.pop(book_id, (category_ids, author_ids))
+        for state, sign, (state_cats, state_authors) in (
+            (before, -1, applied),
+            (after, 1, (category_ids, author_ids)),
+        ):
+            if state is None:
+                continue
+            cat_w, author_w = category_weight(state), author_weight(state)
+            favorite = is_favorite(state)
+            for cat_id in state_cats:
+                self._add(self.category_scores, cat_id, sign * cat_w, sign)
+                if favorite:
+                    self._count(self.favorite_categories, cat_id, sign)
+            for author_id in state_authors:
+                self._add(self.author_scores, author_id, sign * author_w, sign)
+                if favorite:
+                    self._count(self.favorite_authors, author_id, sign)
+        if after is not None:
+            self.links[book_id] = (list(category_ids), list(author_ids))
+
+        was_fav = before is not None and is_favorite(before)
+        is_fav = after is not None and is_favorite(after)
+        was_hated = before is not None and is_hated(before)
+        now_hated = after is not None and is_hated(after)
+        cached = self.favorites.get(book_id, self.hated.get(book_id))
+        if is_fav and not was_fav:
+            self.favorites[book_id] = cached if cached is not None else vector()
+        if now_hated and not was_hated:
+            self.hated[book_id] = cached if cached is not None else vector()
+        if was_fav and not is_fav:
+            self.favorites.pop(book_id, None)
+        if was_hated and not now_hated:
+            self.hated.pop(book_id, None)
+
+    @staticmethod
+    def _add(histogram: Dict[int, List[float]], key: int, delta: float, books: int) -> None:
+        entry = histogram.setdefault(key, [0.0, 0])
+        entry[0] += delta
+        entry[1] += books
+        if entry[1] <= 0:
+            del histogram[key]
+
+    @staticmethod
+    def _count(counts: Dict[int, int], key: int, delta: int) -> None:
+        counts[key] = counts.get(key, 0) + delta
+        if counts[key] <= 0:
+            del counts[key]
+
+    def favorite_vectors(self) -> Optional[sp.csr_matrix]:
+        return sp.vstack(list(self.favorites.values()), format='csr') if self.favorites else None
+
+    def hated_vectors(self) -> Optional[sp.csr_matrix]:
+        return sp.vstack(list(self.hated.values()), format='csr') if self.hated else None
+
+    def top_categories(self, db: Session, limit: int = 6) -> List[str]:
+        """Mesmo resultado de `get_user_favorite_categories`, a partir do histograma"""
+        ranked = sorted(
+            (item for item in self.category_scores.items() if item[1][0] > 0),
+            key=lambda item: (-item[1][0], item[0])
+        )[:limit]
+        return self._names(db, Category, [key for key, _ in ranked])
+
+    def top_authors(self, db: Session, limit: int = 4) -> List[str]:
+        """Mesmo resultado de `get_user_favorite_authors`, a partir do histograma"""
+        ranked = sorted(
+            self.author_scores.items(),
+            key=lambda item: (-item[1][0], item[0])
+        )[:limit]
+        return self._names(db, Author, [key for key, _ in ranked])
+
+    @staticmethod
+    def _names(db: Session, model, ids: List[int]) -> List[str]:
+        if not ids:
+            return []
+        names = dict(db.execute(select(model.id, model.name).where(model.id.in_(ids))).all())
+        return [names[i] for i in ids if i in names]
+
+    def dumps(self) -> bytes:
+        return pickle.dumps((PROFILE_FORMAT, self.__dict__), protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def loads(cls, data: bytes) -> Optional["TasteProfile"]:
+        try:
+            version, state = pickle.loads(data)
+        except Exception:
+            return None
+        if version != PROFILE_FORMAT:
+            return None
+        profile = cls.__new__(cls)
+        profile.__dict__.update(state)
+        return profile
+
+
+def _current_signature() -> Optional[str]:
+    """Versão do vetorizador; None quando o perfil não deve ser usado"""
+    if not settings.PROFILE_CACHE_ENABLED:
+        return None
+    return featurizers.signature()
+
+
+def build_profile(db: Session, user_books: List[UserBook], signature: str) -> TasteProfile:
+    """Montar o perfil do zero (vetorizando favoritos e odiados de uma vez)"""
+    vectorizer = featurizers.get_vectorizer()
+    profile = TasteProfile(signature)
+    categories, authors = links_by_book(db, (b.book_id for b in user_books))
+
+    vectorized = [b for b in user_books if is_favorite((b.user_rating, b.status)) or is_hated((b.user_rating, b.status))]
+    vectors = vectorizer.transform([
+        featurizers.document_text(b.description, b.title) for b in vectorized
+    ]).tocsr() if vectorized else None
+    rows = {b.book_id: i for i, b in enumerate(vectorized)}
+
+    for book in user_books:
+        profile.apply(
+            book.book_id,
+            None,
+            (book.user_rating, book.status),
+            categories.get(book.book_id, []),
+            authors.get(book.book_id, []),
+            lambda book_id=book.book_id: vectors[rows[book_id]]
+        )
+    return profile
+
+
+def _save(db: Session, user_id: int, profile: TasteProfile) -> None:
+    insert = dialect_insert(db)
+    stmt = insert(UserProfile).values(
+        user_id=user_id, version=profile.signature, data=profile.dumps()
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={'version': stmt.excluded.version, 'data': stmt.excluded.data, 'updated_at': stmt.excluded.updated_at}
+    ))
+
+
+def get_profile(db: Session, user_id: int, user_books: List[UserBook]) -> Optional[TasteProfile]:
+    """
+    Perfil do usuário, montado e gravado se ainda não existir (ou estiver desatualizado)
+
+    Returns:
+        O perfil, ou None se o vetorizador não for estável (TF-IDF por requisição)
+    """
+    signature = _current_signature()
+    if signature is None:
+        return None
+
+    row = db.get(UserProfile, user_id)
+    if row is not None and row.version == signature:
+        profile = TasteProfile.loads(row.data)
+        if profile is not None:
+            return profile
+
+    profile = build_profile(db, user_books, signature)
+    # Gravado numa sessão própria: um commit em `db` expiraria os livros da
+    # biblioteca já carregados e cada um seria relido com uma consulta
+    with Session(db.get_bind()) as writer:
+        _save(writer, user_id, profile)
+        writer.commit()
+    return profile
+
+
+def update_profile(
+    db: Session,
+    user_id: int,
+    book_id: str,
+    before: BookState,
+    after: BookState
+) -> None:
+    """
+    Aplicar a mudança de um livro ao perfil, na transação corrente
+
+    Deve ser chamada antes do commit da própria escrita. Sem perfil gravado
+    (ou com um de outra versão) não faz nada: ele será montado na próxima
+    recomendação.
+    """
+    signature = _current_signature()
+    if signature is None or before == after:
+        return
+
+    row = db.query(UserProfile).filter(UserProfile.user_id == user_id).with_for_update().first()
+    if row is None or row.version != signature:
+        return
+
+    profile = TasteProfile.loads(row.data)
+    try:
+        if profile is None:
+            raise ValueError("perfil ilegível")
+        book = db.get(Book, book_id)
+        categories, authors = links_by_book(db, [book_id])
+        profile.apply(
+            book_id,
+            before,
+            after,
+            categories.get(book_id, []),
+            authors.get(book_id, []),
+            lambda: featurizers.get_vectorizer().transform([
+                featurizers.document_text(book.description if book else '', book.title if book else '')
+            ]).tocsr()
+        )
+        row.data = profile.dumps()
+    except Exception as e:
+        # Perfil descartado: será montado de novo na próxima recomendação
+        print(f"Erro ao atualizar o perfil do usuário {user_id}: {e}")
+        db.delete(row)
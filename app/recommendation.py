@@ -1,17 +1,26 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-from typing import List
+from typing import Dict, List, Optional, Set
 import random
-from .models import UserBook
+from sqlalchemy import and_, case, func
+from sqlalchemy.orm import Session
+from . import featurizers
+from .catalog import linked_ids, lookup_name_ids, name_key
+from .models import Author, Category, UserBook, book_authors, book_categories
+from .profiles import TasteProfile
 
 def generate_recommendations(
     user_books: List[UserBook],
     candidate_books: List[dict],
-    limit: int = 12
+    db: Session,
+    limit: int = 12,
+    profile: Optional[TasteProfile] = None
 ) -> List[dict]:
     """
     Gera recomendações refinadas com penalização de livros odiados.
+
+    Gêneros e autores são comparados pelos ids das tabelas normalizadas.
+    Com o perfil de gosto (app/profiles.py), só os candidatos são vetorizados.
     """
     
     # 1. MELHORIA: Definição mais estrita de "Favoritos"
@@ -30,37 +39,33 @@ def generate_recommendations(
     if not favorites or not candidate_books:
         return []
 
-    # Preparar descrições (Favoritos e Odiados)
-    fav_descriptions = [b.description or b.title or "" for b in favorites]
-    hated_descriptions = [b.description or b.title or "" for b in hated_books]
-    
     cand_descriptions = [
-        b.get('description', '') or b.get('title', '')
+        featurizers.document_text(b.get('description', ''), b.get('title', ''))
         for b in candidate_books
     ]
 
-    # Limpeza básica
-    def clean_text(texts):
-        return [t if t.strip() else "no description" for t in texts]
-
-    fav_descriptions = clean_text(fav_descriptions)
-    hated_descriptions = clean_text(hated_descriptions)
-    cand_descriptions = clean_text(cand_descriptions)
-
-    # TF-IDF Setup
-    vectorizer = TfidfVectorizer(
-        max_features=1500, # Aumentei um pouco para captar mais nuances
-        stop_words='english', # Idealmente, use stop_words em português se os livros forem BR
-        ngram_range=(1, 2)
-    )
-
     try:
-        # Treinar com tudo para ter o vocabulário completo
-        all_corpus = fav_descriptions + hated_descriptions + cand_descriptions
-        vectorizer.fit(all_corpus)
-        
-        cand_vectors = vectorizer.transform(cand_descriptions)
-        fav_vectors = vectorizer.transform(fav_descriptions)
+        if profile is not None:
+            # Favoritos e odiados já vetorizados no perfil
+            vectorizer = featurizers.get_vectorizer()
+            fav_vectors = profile.favorite_vectors()
+            hated_vectors = profile.hated_vectors()
+            cand_vectors = vectorizer.transform(cand_descriptions)
+        else:
+            # Preparar descrições (Favoritos e Odiados)
+            fav_descriptions = [featurizers.document_text(b.description, b.title) for b in favorites]
+            hated_descriptions = [featurizers.document_text(b.description, b.title) for b in hated_books]
+
+            # Vetorizador do modo configurado (TF-IDF pré-treinado ou hashing);
+            # sem ele, treinar aqui com tudo para ter o vocabulário completo
+            vectorizer = featurizers.get_vectorizer()
+            if vectorizer is None:
+                all_corpus = fav_descriptions + hated_descriptions + cand_descriptions
+                vectorizer = featurizers.fit_request_vectorizer(all_corpus)
+
+            cand_vectors = vectorizer.transform(cand_descriptions)
+            fav_vectors = vectorizer.transform(fav_descriptions)
+            hated_vectors = vectorizer.transform(hated_descriptions) if hated_books else None
         
         # Calcular similaridade com favoritos (Bônus)
         # Retorna matriz [n_candidatos, n_favoritos]
@@ -75,131 +80,162 @@ def generate_recommendations(
 
         # Calcular similaridade com odiados (Penalidade)
         penalty_scores = np.zeros(len(candidate_books))
-        if hated_vectors := vectorizer.transform(hated_descriptions) if hated_books else None:
-            if hated_vectors.shape[0] > 0:
-                sim_hated = cosine_similarity(cand_vectors, hated_vectors)
-                penalty_scores = sim_hated.max(axis=1)
+        if hated_vectors is not None and hated_vectors.shape[0] > 0:
+            sim_hated = cosine_similarity(cand_vectors, hated_vectors)
+            penalty_scores = sim_hated.max(axis=1)
 
     except Exception as e:
         print(f"Erro no TF-IDF: {e}")
         semantic_scores = np.zeros(len(candidate_books))
         penalty_scores = np.zeros(len(candidate_books))
 
-    # Scoring Final
+    # Categorias/autores dos favoritos (ids) e ids dos nomes dos candidatos,
+    # uma consulta cada, fora do loop
+    if profile is not None:
+        fav_cat_ids, fav_author_ids = set(profile.favorite_categories), set(profile.favorite_authors)
+    else:
+        fav_cat_ids, fav_author_ids = linked_ids(db, (f.book_id for f in favorites))
+    cat_ids = lookup_name_ids(db, Category, (
+        name_key(c) for book in candidate_books for c in book.get('categories', [])
+    ))
+    author_ids = lookup_name_ids(db, Author, (
+        name_key(a) for book in candidate_books for a in book.get('authors', [])
+    ))
+
+    # Scoring Final (vetorizado sobre os candidatos; mesma ordem de operações
+    # do cálculo por livro, para os scores serem idênticos)
+    first_cat = _first_matches(candidate_books, 'categories', cat_ids, fav_cat_ids)
+    first_author = _first_matches(candidate_books, 'authors', author_ids, fav_author_ids)
+    ratings = np.array(
+        [book.get('rating', 0) or 0 for book in candidate_books], dtype=np.float64
+    )
+
+    # 1. Similaridade Semântica (45%)
+    scores = np.asarray(semantic_scores, dtype=np.float64) * 0.45
+
+    # 2. Penalidade por similaridade com livro ruim (-25%)
+    # Só penaliza se for realmente muito parecido; não gera "motivo"
+    penalties = np.asarray(penalty_scores, dtype=np.float64)
+    scores = np.where(penalties > 0.4, scores - penalties * 0.25, scores)
+
+    # 3. Category Match (30%) e 4. Author Match (15%)
+    scores = np.where(first_cat >= 0, scores + 0.3, scores)
+    scores = np.where(first_author >= 0, scores + 0.15, scores)
+
+    # 5. Rating Global Bonus (10%)
+    scores = np.where(
+        ratings >= 4.5, scores + 0.1,
+        np.where(ratings >= 4.0, scores + 0.05, scores)
+    )
+
+    # Só scores relevantes; arredondados com round() do Python (3 casas para desempate)
+    kept = np.flatnonzero(scores > 0.25)
+    if not len(kept):
+        return []
+    rounded = np.array([round(float(score), 3) for score in scores[kept]])
+
+    # Top-`limit` com argpartition; quem empata com o último entra na
+    # disputa para manter a ordem estável (maior score, depois ordem original)
+    if len(kept) > limit:
+        boundary = rounded[np.argpartition(-rounded, limit - 1)[limit - 1]]
+        contenders = np.flatnonzero(rounded >= boundary)
+    else:
+        contenders = np.arange(len(kept))
+    top = contenders[np.lexsort((contenders, -rounded[contenders]))][:limit]
+
     recommendations = []
-    
-    for i, book in enumerate(candidate_books):
-        score = 0.0
+    for j in top:
+        i = kept[j]
+        book = candidate_books[i]
         reasons = []
-        
-        # 1. Similaridade Semântica (45%)
-        sem_score = float(semantic_scores[i])
-        score += sem_score * 0.45
-        
-        # 2. Penalidade por similaridade com livro ruim (-25%)
-        pen_score = float(penalty_scores[i])
-        if pen_score > 0.4: # Só penaliza se for realmente muito parecido
-            score -= pen_score * 0.25
-            # Não adicionamos "motivo" para penalidade, apenas baixamos o score
-        
-        # 3. Category Match (30%)
-        # Aqui usamos set intersection para ser mais rápido
-        book_cats = set([c.strip().lower() for c in book.get('categories', [])])
-        
-        # Coletar categorias dos favoritos
-        fav_cats = set()
-        for f in favorites:
-            if f.categories:
-                fav_cats.update([c.strip().lower() for c in f.categories.split(',')])
-        
-        if book_cats & fav_cats:
-            score += 0.3
-            cat_name = list(book_cats & fav_cats)[0].title()
-            reasons.append(f"Gênero: {cat_name}")
-
-        # 4. Author Match (15%)
-        book_authors = set([a.strip().lower() for a in book.get('authors', [])])
-        fav_authors = set()
-        for f in favorites:
-            if f.authors:
-                fav_authors.update([a.strip().lower() for a in f.authors.split(',')])
-                
-        if book_authors & fav_authors:
-            score += 0.15
-            auth_name = list(book_authors & fav_authors)[0].title()
-            reasons.append(f"Autor: {auth_name}")
-
-        # 5. Rating Global Bonus (10%)
-        google_rating = book.get('rating', 0) or 0
-        if google_rating >= 4.5:
-            score += 0.1
+        if first_cat[i] >= 0:
+            reasons.append(f"Gênero: {book['categories'][first_cat[i]].strip().title()}")
+        if first_author[i] >= 0:
+            reasons.append(f"Autor: {book['authors'][first_author[i]].strip().title()}")
+        if ratings[i] >= 4.5:
             reasons.append("Aclamado pela crítica")
-        elif google_rating >= 4.0:
-            score += 0.05
+        recommendations.append({
+            'book': book,
+            'score': float(rounded[j]),
+            'reason': ' • '.join(reasons[:2]) if reasons else 'Baseado no seu perfil'
+        })
+    return recommendations
 
-        # Adicionar à lista se score for relevante
-        if score > 0.25:
-            recommendations.append({
-                'book': book,
-                'score': round(score, 3), # 3 casas para desempate
-                'reason': ' • '.join(reasons[:2]) if reasons else 'Baseado no seu perfil'
-            })
 
-    # Ordenar
-    recommendations.sort(key=lambda x: x['score'], reverse=True)
-    return recommendations[:limit]
+def _first_matches(
+    candidate_books: List[dict],
+    field: str,
+    ids: Dict[str, int],
+    wanted: Set[int]
+) -> np.ndarray:
+    """
+    Posição, em `book[field]`, do primeiro nome cujo id está em `wanted`
 
+    Returns:
+        Array com uma posição por candidato (-1 quando nenhum nome casa)
+    """
+    owners, positions, link_ids = [], [], []
+    for i, book in enumerate(candidate_books):
+        for position, name in enumerate(book.get(field, [])):
+            owners.append(i)
+            positions.append(position)
+            link_ids.append(ids.get(name_key(name), -1))
+
+    first = np.full(len(candidate_books), -1)
+    if owners:
+        matched = np.isin(np.array(link_ids), np.fromiter(wanted, dtype=np.int64, count=len(wanted)))
+        # Os pares estão em ordem, então a primeira ocorrência é o primeiro match
+        candidates, index = np.unique(np.array(owners)[matched], return_index=True)
+        first[candidates] = np.array(positions)[matched][index]
+    return first
 
-def get_user_favorite_categories(user_books: List[UserBook]) -> List[str]:
+
+def get_user_favorite_categories(db: Session, user_id: int) -> List[str]:
     """
-    Retorna categorias favoritas ponderadas pela nota.
+    Retorna categorias favoritas ponderadas pela nota (agregação no banco).
     Ex: Um livro nota 5 vale 3 pontos de categoria. Um livro nota 3 vale 1 ponto.
     """
-    category_scores = {}
-    
-    for book in user_books:
-        if not book.categories: continue
-        
-        # Definir peso base
-        weight = 1
-        if book.user_rating:
-            if book.user_rating == 5: weight = 3
-            elif book.user_rating == 4: weight = 2
-            elif book.user_rating <= 2: weight = -1 # Penaliza categorias de livros ruins
-        elif book.status == 'finished':
-            weight = 1.5 # Lido sem nota vale mais que não lido
-            
-        categories = [c.strip() for c in book.categories.split(',')]
-        for cat in categories:
-            if cat:
-                category_scores[cat] = category_scores.get(cat, 0) + weight
+    weight = case(
+        (UserBook.user_rating == 5, 3.0),
+        (UserBook.user_rating == 4, 2.0),
+        (and_(UserBook.user_rating > 0, UserBook.user_rating <= 2), -1.0), # Penaliza categorias de livros ruins
+        (UserBook.user_rating > 0, 1.0),
+        (UserBook.status == 'finished', 1.5), # Lido sem nota vale mais que não lido
+        else_=1.0
+    )
+    score = func.sum(weight)
 
     # Remove categorias com pontuação negativa ou zero
-    valid_cats = {k: v for k, v in category_scores.items() if v > 0}
-    
-    sorted_cats = sorted(valid_cats.items(), key=lambda x: x[1], reverse=True)
-    
-    # MELHORIA: Retornar top 5, mas garantir que não é sempre estático se houver empate
-    # Retorna chaves
-    return [c[0] for c in sorted_cats[:6]]
+    rows = db.query(Category.name).join(
+        book_categories, book_categories.c.category_id == Category.id
+    ).join(
+        UserBook, UserBook.book_id == book_categories.c.book_id
+    ).filter(
+        UserBook.user_id == user_id
+    ).group_by(Category.id, Category.name).having(score > 0).order_by(
+        score.desc(), Category.id
+    ).limit(6)
 
+    return [row[0] for row in rows]
 
-def get_user_favorite_authors(user_books: List[UserBook]) -> List[str]:
-    """Mesma lógica ponderada para autores"""
-    author_scores = {}
-    
-    for book in user_books:
-        if not book.authors: continue
-        
-        weight = 1
-        if book.user_rating:
-            if book.user_rating >= 4: weight = 3
-            elif book.user_rating <= 2: weight = 0 # Ignora autores ruins
-        
-        authors = [a.strip() for a in book.authors.split(',')]
-        for author in authors:
-            if author:
-                author_scores[author] = author_scores.get(author, 0) + weight
 
-    sorted_authors = sorted(author_scores.items(), key=lambda x: x[1], reverse=True)
-    return [a[0] for a in sorted_authors[:4]]
\ No newline at end of file
+def get_user_favorite_authors(db: Session, user_id: int) -> List[str]:
+    """Mesma lógica ponderada para autores"""
+    weight = case(
+        (UserBook.user_rating >= 4, 3),
+        (and_(UserBook.user_rating > 0, UserBook.user_rating <= 2), 0), # Ignora autores ruins
+        else_=1
+    )
+    score = func.sum(weight)
+
+    rows = db.query(Author.name).join(
+        book_authors, book_authors.c.author_id == Author.id
+    ).join(
+        UserBook, UserBook.book_id == book_authors.c.book_id
+    ).filter(
+        UserBook.user_id == user_id
+    ).group_by(Author.id, Author.name).order_by(
+        score.desc(), Author.id
+    ).limit(4)
+
+    return [row[0] for row in rows]
@@ -0,0 +1,496 @@
+"""
+Resiliência das fontes externas de livros
+
+- LatencyTracker: janela das latências recentes (percentis)
+- CircuitBreaker: disjuntor closed/open/half-open com timeout adaptativo
+- TokenBucket: limitador de taxa com fila por prioridade e cota diária
+- Hedger: requisições "hedged" contra a cauda de latência
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from .config import settings
+
+
+class CircuitOpenError(Exception):
+    """Fonte desativada temporariamente pelo circuit breaker"""
+
+    def __init__(self, name: str):
+        super().__init__(f"circuito aberto para '{name}'")
+        self.name = name
+
+
+class RateLimitedError(Exception):
+    """Sem token disponível no prazo (ou cota diária esgotada)"""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"limite de taxa para '{name}': {reason}")
+        self.name = name
+
+
+# Prioridades do limitador (menor = atendido primeiro)
+PRIORITY_INTERACTIVE = 0  # busca feita pelo usuário
+PRIORITY_PREFETCH = 1  # candidatos de recomendação
+
+
+class LatencyTracker:
+    """Latências (segundos) das últimas `window` chamadas bem-sucedidas"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+
+    def add(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Percentil `p` (0-100) pelo método nearest-rank; None sem amostras"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(1, math.ceil(p / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por fonte, com timeout adaptativo.
+
+    - closed: chamadas passam; `failure_threshold` falhas seguidas abrem
+    - open: chamadas falham imediatamente por `recovery_time` segundos
+    - half_open: uma única chamada de teste; sucesso fecha, falha reabre
+
+    O timeout de cada chamada é o percentil configurado das latências
+    recentes vezes um multiplicador, limitado a [min_timeout, max_timeout].
+    Resultados de chamadas iniciadas antes da última mudança de estado são
+    ignorados: só a chamada de teste decide o half-open.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    MIN_SAMPLES = 20  # amostras antes de confiar no timeout adaptativo
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_time: float = 30.0,
+        timeout_percentile: float = 99.0,
+        timeout_multiplier: float = 2.0,
+        min_timeout: float = 1.0,
+        max_timeout: float = 10.0
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+
+        self.latencies = LatencyTracker()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        # Incrementada a cada mudança de estado
+        self._generation = 0
+
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def allow_request(self) -> bool:
+        """Decide se a chamada pode seguir (e inicia o half-open se for hora)"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_time:
+                return False
+            self._set_state(self.HALF_OPEN)
+
+        # half-open: só uma chamada de teste por vez
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            self.state = state
+            self._generation += 1
+
+    def record_success(self, latency: float) -> None:
+        self.successes += 1
+        self.latencies.add(latency)
+        self.consecutive_failures = 0
+        self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                print(f"⚠️ Circuito aberto para '{self.name}'")
+            self._set_state(self.OPEN)
+            self.opened_at = time.monotonic()
+
+    def timeout(self) -> float:
+        """Timeout adaptativo para a próxima chamada"""
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return self.max_timeout
+        observed = self.latencies.percentile(self.timeout_percentile)
+        return min(self.max_timeout, max(self.min_timeout, observed * self.timeout_multiplier))
+
+    @staticmethod
+    def _is_failure(error: Exception) -> bool:
+        """Erros 4xx (exceto 429) são da requisição, não da saúde da fonte"""
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+            return status >= 500 or status == 429
+        return True
+
+    async def call(
+        self,
+        fn: Callable[[float], Awaitable[Any]],
+        before: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        """
+        Executar `fn(timeout)` protegido pelo disjuntor
+
+        Args:
+            fn: Chamada à fonte, recebe o timeout
+            before: Executado só se a chamada for admitida (ex.: pegar um
+                token do limitador), para não gastar cota com chamadas recusadas
+
+        Raises:
+            CircuitOpenError: Se a fonte estiver desativada
+        """
+        if not self.allow_request():
+            self.rejected += 1
+            raise CircuitOpenError(self.name)
+        is_probe = self.state == self.HALF_OPEN
+        generation = self._generation
+
+        try:
+            if before is not None:
+                await before()
+            started = time.monotonic()
+            try:
+                result = await fn(self.timeout())
+            except Exception as e:
+                if self._generation == generation:
+                    if self._is_failure(e):
+                        self.record_failure()
+                    else:
+                        self.record_success(time.monotonic() - started)
+                raise
+        finally:
+            if is_probe:
+                self._probe_in_flight = False
+
+        if self._generation == generation:
+            self.record_success(time.monotonic() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.latencies.percentile(50)
+        p99 = self.latencies.percentile(99)
+        return {
+            'state': self.state,
+            'timeout': round(self.timeout(), 3),
+            'p50': round(p50, 3) if p50 is not None else None,
+            'p99': round(p99, 3) if p99 is not None else None,
+            'successes': self.successes,
+            'failures': self.failures,
+            'rejected': self.rejected
+        }
+
+
+class TokenBucket:
+    """
+    Token bucket assíncrono compartilhado por todas as chamadas a uma fonte.
+
+    Os tokens são repostos a `rate` por segundo até `capacity` (rajada).
+    Sem token livre, a chamada entra numa fila por prioridade e espera no
+    máximo `max_wait[prioridade]` segundos. Uma cota diária opcional
+    (reiniciada à meia-noite UTC) recusa chamadas depois de esgotada.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        capacity: int,
+        daily_quota: Optional[int] = None,
+        max_wait: Optional[Dict[int, float]] = None
+    ):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.daily_quota = daily_quota
+        self.max_wait = max_wait or {PRIORITY_INTERACTIVE: 2.0, PRIORITY_PREFETCH: 0.5}
+
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._waiters: list = []  # heap de (prioridade, ordem, future)
+        self._order = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+        self.quota_day = self._today()
+        self.quota_used = 0
+        self.granted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def quota_exhausted(self) -> bool:
+        """True se a cota diária acabou (reinicia o contador na virada do dia)"""
+        today = self._today()
+        if today != self.quota_day:
+            self.quota_day = today
+            self.quota_used = 0
+        return self.daily_quota is not None and self.quota_used >= self.daily_quota
+
+    def _take(self) -> None:
+        self.tokens -= 1
+        self.quota_used += 1
+        self.granted += 1
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE) -> None:
+        """
+        Obter um token, esperando na fila se necessário
+
+        Raises:
+            RateLimitedError: Cota esgotada ou prazo de espera excedido
+        """
+        if self.quota_exhausted():
+            self.rejected += 1
+            raise RateLimitedError(self.name, "cota diária esgotada")
+
+        self._refill()
+        if self.tokens >= 1 and not self._waiters:
+            self._take()
+            return
+
+        max_wait = self.max_wait.get(priority, 0)
+        if max_wait <= 0:
+            self.rejected += 1
+            raise RateLimitedError(self.name, "sem tokens")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self.queued += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        try:
+            await asyncio.wait_for(future, max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise RateLimitedError(self.name, f"sem tokens em {max_wait}s")
+        except RateLimitedError:
+            self.rejected += 1
+            raise
+
+    async def _dispatch(self) -> None:
+        """Entregar tokens aos que esperam, na ordem de prioridade"""
+        while self._waiters:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # Desistiu por timeout
+                continue
+            if self.quota_exhausted():
+                future.set_exception(RateLimitedError(self.name, "cota diária esgotada"))
+                continue
+            self._take()
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        self.quota_exhausted()
+        return {
+            'tokens': round(self.tokens, 2),
+            'rate': self.rate,
+            'capacity': self.capacity,
+            'waiting': sum(1 for *_, f in self._waiters if not f.done()),
+            'granted': self.granted,
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'quota_day': self.quota_day,
+            'quota_used': self.quota_used,
+            'quota_limit': self.daily_quota
+        }
+
+
+class Hedger:
+    """
+    Requisições hedged: se a primeira chamada não respondeu até o percentil
+    observado (ex.: p90), dispara uma duplicata e fica com a que responder
+    primeiro (a outra é cancelada).
+
+    O orçamento limita as duplicatas a `budget_ratio` das chamadas
+    primárias, para que uma fonte lenta não receba o dobro de carga.
+    """
+
+    MIN_SAMPLES = 20  # amostras antes de hedgear
+
+    def __init__(
+        self,
+        name: str,
+        latencies: LatencyTracker,
+        percentile: float = 90.0,
+        budget_ratio: float = 0.1,
+        min_delay: float = 0.05
+    ):
+        self.name = name
+        self.latencies = latencies
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.min_delay = min_delay
+
+        self.primary = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_denied = 0
+
+    def delay(self) -> Optional[float]:
+        """Tempo de espera antes da duplicata (None = sem dados suficientes)"""
+        if len(self.latencies) < self.MIN_SAMPLES:
+            return None
+        return max(self.min_delay, self.latencies.percentile(self.percentile))
+
+    def _within_budget(self) -> bool:
+        return self.hedged < self.budget_ratio * self.primary
+
+    async def run(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Executar `fn()` com hedging
+
+        Returns:
+            Resultado da primeira chamada bem-sucedida (se ambas falharem,
+            propaga o erro da primária)
+        """
+        self.primary += 1
+        delay = self.delay()
+        first = asyncio.ensure_future(fn())
+        pending = {first}
+        try:
+            if delay is None:
+                return await first
+
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+
+            if not self._within_budget():
+                self.budget_denied += 1
+                return await first
+
+            self.hedged += 1
+            second = asyncio.ensure_future(fn())
+            pending.add(second)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+            return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        delay = self.delay()
+        return {
+            'delay': round(delay, 3) if delay is not None else None,
+            'primary': self.primary,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'budget_denied': self.budget_denied
+        }
+
+
+def _build_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+        recovery_time=settings.CIRCUIT_RECOVERY_TIME,
+        timeout_percentile=settings.ADAPTIVE_TIMEOUT_PERCENTILE,
+        timeout_multiplier=settings.ADAPTIVE_TIMEOUT_MULTIPLIER,
+        min_timeout=settings.ADAPTIVE_TIMEOUT_MIN,
+        max_timeout=settings.HTTP_TIMEOUT
+    )
+
+
+# Um disjuntor por fonte externa
+breakers: Dict[str, CircuitBreaker] = {
+    'google': _build_breaker('google'),
+    'openlibrary': _build_breaker('openlibrary'),
+}
+
+
+# Um limitador de taxa por fonte externa
+limiters: Dict[str, TokenBucket] = {
+    'google': TokenBucket(
+        'google',
+        rate=settings.GOOGLE_RATE_LIMIT,
+        capacity=settings.GOOGLE_RATE_BURST,
+        daily_quota=settings.GOOGLE_DAILY_QUOTA,
+        max_wait={
+            PRIORITY_INTERACTIVE: settings.RATE_LIMIT_MAX_WAIT,
+            PRIORITY_PREFETCH: settings.RATE_LIMIT_PREFETCH_MAX_WAIT
+        }
+    ),
+    'openlibrary': TokenBucket(
+        'openlibrary',
+        rate=settings.OPENLIBRARY_RATE_LIMIT,
+        capacity=settings.OPENLIBRARY_RATE_BURST,
+        max_wait={
+            PRIORITY_INTERACTIVE: settings.RATE_LIMIT_MAX_WAIT,
+            PRIORITY_PREFETCH: settings.RATE_LIMIT_PREFETCH_MAX_WAIT
+        }
+    ),
+}
+
+
+# Hedging (opcional) da Open Library, usando as latências do seu disjuntor
+hedgers: Dict[str, Hedger] = {
+    'openlibrary': Hedger(
+        'openlibrary',
+        breakers['openlibrary'].latencies,
+        percentile=settings.HEDGE_PERCENTILE,
+        budget_ratio=settings.HEDGE_BUDGET_RATIO,
+        min_delay=settings.HEDGE_MIN_DELAY
+    ),
+}
@@ -1,19 +1,35 @@
+import asyncio
+
 from fastapi import APIRouter, Request, Depends, Form, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 
 from ..config import settings
-from ..database import get_db
-from ..models import UserBook, User
+from ..database import get_db, SessionLocal, dialect_insert
+from ..models import Book, UserBook, User
 from ..auth import require_auth
 from ..book_apis import UnifiedBookAPI
+from ..library import LibraryMembership, adjust_library_stats, get_library_page
+from ..catalog import upsert_books
+from ..profiles import update_profile
 from ..templating import templates
 
 router = APIRouter()
 
 GOOGLE_BOOKS_API_KEY = settings.GOOGLE_BOOKS_API_KEY
 
+
+def _resolve_sources(source: str) -> list:
+    """Converter o filtro da tela na lista de fontes da API unificada"""
+    if source == "google":
+        return ['google']
+    if source == "openlibrary":
+        return ['openlibrary']
+    if source == "local":
+        return ['local']
+    return ['google', 'openlibrary']
+
 @router.get("/search", response_class=HTMLResponse)
 async def search_page(request: Request, db: Session = Depends(get_db)):
     # Página de busca
@@ -28,7 +44,7 @@ async def search_page(request: Request, db: Session = Depends(get_db)):
 async def search_books(
     request: Request,
     q: str,
-    source: str = "all",  # all, google, openlibrary
+    source: str = "all",  # all, google, openlibrary, local
     db: Session = Depends(get_db)
 ):
     """Buscar livros (retorna HTML)"""
@@ -41,33 +57,31 @@ async def search_books(
             "error": "Digite pelo menos 2 caracteres"
         })
     
+    sources = _resolve_sources(source)
+    
+    # Com mais de uma fonte, devolver o contêiner de streaming: cada fonte
+    # aparece assim que responde (ver /search-stream)
+    if settings.SEARCH_STREAMING and len(sources) > 1:
+        return templates.TemplateResponse("partials/search_stream.html", {
+            "request": request,
+            "query": q,
+            "source": source
+        })
+    
     try:
-        # Definir fontes de busca
-        sources = []
-        if source == "all":
-            sources = ['google', 'openlibrary']
-        elif source == "google":
-            sources = ['google']
-        elif source == "openlibrary":
-            sources = ['openlibrary']
-        else:
-            sources = ['google', 'openlibrary']
-        
         # Buscar usando API unificada
-        books = UnifiedBookAPI.search_books(
+        books = await UnifiedBookAPI.search_books(
             query=q,
             sources=sources,
             limit_per_source=15,
-            google_api_key=GOOGLE_BOOKS_API_KEY
+            google_api_key=GOOGLE_BOOKS_API_KEY,
+            db=db
         )
         
-        # Verificar quais livros já estão na biblioteca
-        for book in books:
-            existing = db.query(UserBook).filter(
-                UserBook.user_id == user.id,
-                UserBook.book_id == book['id']
-            ).first()
-            book['in_library'] = existing is not None
+        # Verificar quais livros já estão na biblioteca (uma única consulta)
+        LibraryMembership.for_books(
+            db, user.id, (book['id'] for book in books)
+        ).annotate(books)
         
         return templates.TemplateResponse("partials/search_results.html", {
             "request": request,
@@ -85,6 +99,93 @@ async def search_books(
         })
 
 
+@router.get("/search-stream")
+async def search_books_stream(
+    request: Request,
+    q: str,
+    source: str = "all",
+    db: Session = Depends(get_db)
+):
+    """Buscar livros progressivamente (Server-Sent Events consumidos pelo HTMX)"""
+    user = await require_auth(request, db)
+    sources = _resolve_sources(source) if q and len(q.strip()) >= 2 else []
+    
+    def sse(event: str, html: str) -> str:
+        data = '\n'.join(f"data: {line}" for line in html.splitlines() or [''])
+        return f"event: {event}\n{data}\n\n"
+    
+    async def events():
+        # Sessão própria: o streaming continua depois que o handler retorna
+        stream_db = SessionLocal()
+        seen_titles = set()
+        total = 0
+        tasks = [
+            asyncio.create_task(UnifiedBookAPI.search_books(
+                query=q,
+                sources=[s],
+                limit_per_source=15,
+                google_api_key=GOOGLE_BOOKS_API_KEY,
+                db=stream_db
+            ))
+            for s in sources
+        ]
+        failed = False
+        try:
+            # O "done" sai mesmo se algo falhar no meio: sem ele a conexão cai,
+            # o EventSource reconecta e a busca inteira é reenviada (cards duplicados)
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    try:
+                        books = await next_done
+                    except Exception as e:
+                        print(f"Erro na busca: {e}")
+                        continue
+                    
+                    if await request.is_disconnected():
+                        return
+                    
+                    # Mesma regra de _remove_duplicates, contra o que já foi enviado
+                    new_books = []
+                    for book in books:
+                        title_normalized = book['title'].lower().strip()
+                        if title_normalized not in seen_titles:
+                            seen_titles.add(title_normalized)
+                            new_books.append(book)
+                    if not new_books:
+                        continue
+                    
+                    LibraryMembership.for_books(
+                        stream_db, user.id, (book['id'] for book in new_books)
+                    ).annotate(new_books)
+                    
+                    total += len(new_books)
+                    html = ''.join(
+                        templates.get_template("partials/search_result_card.html").render(book=book)
+                        for book in new_books
+                    )
+                    yield sse("results", html)
+            except Exception as e:
+                print(f"Erro na busca em streaming: {e}")
+                stream_db.rollback()
+                failed = True
+            
+            yield sse("done", templates.get_template("partials/search_stream_done.html").render(
+                total=total,
+                query=q,
+                failed=failed
+            ))
+        finally:
+            for task in tasks:
+                task.cancel()
+            stream_db.close()
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/library", response_class=HTMLResponse)
 async def library_page(request: Request, db: Session = Depends(get_db)):
     """Página da biblioteca"""
@@ -93,18 +194,16 @@ async def library_page(request: Request, db: Session = Depends(get_db)):
     # Obter filtro de status
     status_filter = request.query_params.get('status', 'all')
     
-    query = db.query(UserBook).filter(UserBook.user_id == user.id)
-    
-    if status_filter != 'all':
-        query = query.filter(UserBook.status == status_filter)
-    
-    books = query.order_by(UserBook.added_at.desc()).all()
+    books, next_cursor = get_library_page(
+        db, user.id, status_filter, limit=settings.LIBRARY_PAGE_SIZE
+    )
     
     return templates.TemplateResponse("library.html", {
         "request": request,
         "user": user,
         "books": books,
-        "status_filter": status_filter
+        "status_filter": status_filter,
+        "next_cursor": next_cursor
     })
 
 
@@ -112,21 +211,22 @@ async def library_page(request: Request, db: Session = Depends(get_db)):
 async def library_content(
     request: Request,
     status: str = "all",
+    cursor: str | None = None,
     db: Session = Depends(get_db)
 ):
-    """Conteúdo da biblioteca (HTMX)"""
+    """Conteúdo da biblioteca (HTMX); com cursor, devolve só a próxima página"""
     user = await require_auth(request, db)
     
-    query = db.query(UserBook).filter(UserBook.user_id == user.id)
-    
-    if status != 'all':
-        query = query.filter(UserBook.status == status)
-    
-    books = query.order_by(UserBook.added_at.desc()).all()
+    books, next_cursor = get_library_page(
+        db, user.id, status, cursor=cursor, limit=settings.LIBRARY_PAGE_SIZE
+    )
     
-    return templates.TemplateResponse("partials/library_content.html", {
+    template = "partials/library_page.html" if cursor else "partials/library_content.html"
+    return templates.TemplateResponse(template, {
         "request": request,
-        "books": books
+        "books": books,
+        "status_filter": status,
+        "next_cursor": next_cursor
     })
 
 
@@ -134,45 +234,43 @@ async def library_content(
 async def add_book(
     request: Request,
     book_id: str = Form(...),
-    title: str = Form(...),
-    authors: str = Form(""),
-    description: str = Form(""),
-    categories: str = Form(""),
-    thumbnail: str = Form(""),
-    rating: float = Form(0.0),
     db: Session = Depends(get_db)
 ):
     """Adicionar livro à biblioteca"""
     user = await require_auth(request, db)
     
-    # Verificar se já existe
-    existing = db.query(UserBook).filter(
-        UserBook.user_id == user.id,
-        UserBook.book_id == book_id
-    ).first()
-    
-    if existing:
-        return HTMLResponse(
-            content='<div class="text-red-600 text-sm">✗ Livro já está na biblioteca</div>',
-            headers={"HX-Reswap": "innerHTML", "HX-Retarget": f"#status-{book_id}"}
-        )
+    # O catálogo é compartilhado: os dados do livro nunca vêm do formulário.
+    # Se ele ainda não estiver lá, é buscado na fonte de origem pelo ID
+    if db.get(Book, book_id) is None:
+        book = await UnifiedBookAPI.get_book(book_id, google_api_key=GOOGLE_BOOKS_API_KEY)
+        if book is None:
+            return HTMLResponse(
+                content='<div class="text-red-600 text-sm">✗ Livro não encontrado</div>',
+                headers={"HX-Reswap": "innerHTML", "HX-Retarget": f"#status-{book_id}"}
+            )
+        upsert_books(db, [book], commit=False, update_existing=False)
     
-    # Adicionar livro
-    new_book = UserBook(
+    # Upsert: INSERT ... ON CONFLICT DO NOTHING no índice (user_id, book_id).
+    # Uma ida ao banco e sem corrida entre dois cliques simultâneos
+    insert = dialect_insert(db)
+    stmt = insert(UserBook).values(
         user_id=user.id,
         book_id=book_id,
-        title=title,
-        authors=authors,
-        description=description,
-        categories=categories,
-        thumbnail=thumbnail,
-        google_rating=rating,
         status='want_to_read'
-    )
+    ).on_conflict_do_nothing(index_elements=['user_id', 'book_id'])
     
-    db.add(new_book)
+    result = db.execute(stmt)
+    if result.rowcount:
+        adjust_library_stats(db, user.id, None, 'want_to_read')
+        update_profile(db, user.id, book_id, None, (None, 'want_to_read'))
     db.commit()
     
+    if result.rowcount == 0:
+        return HTMLResponse(
+            content='<div class="text-red-600 text-sm">✗ Livro já está na biblioteca</div>',
+            headers={"HX-Reswap": "innerHTML", "HX-Retarget": f"#status-{book_id}"}
+        )
+    
     return HTMLResponse(
         content='<div class="text-green-600 text-sm">✓ Adicionado à biblioteca!</div>',
         headers={"HX-Reswap": "innerHTML", "HX-Retarget": f"#status-{book_id}"}
@@ -197,6 +295,8 @@ async def update_status(
     if not book:
         raise HTTPException(status_code=404, detail="Livro não encontrado")
     
+    adjust_library_stats(db, user.id, book.status, status)
+    update_profile(db, user.id, book.book_id, (book.user_rating, book.status), (book.user_rating, status))
     book.status = status
     db.commit()
     
@@ -225,6 +325,7 @@ async def rate_book(
     if not book:
         raise HTTPException(status_code=404, detail="Livro não encontrado")
     
+    update_profile(db, user.id, book.book_id, (book.user_rating, book.status), (rating, book.status))
     book.user_rating = rating
     db.commit()
     
@@ -252,6 +353,8 @@ async def delete_book(
     if not book:
         raise HTTPException(status_code=404, detail="Livro não encontrado")
     
+    adjust_library_stats(db, user.id, book.status, None)
+    update_profile(db, user.id, book.book_id, (book.user_rating, book.status), None)
     db.delete(book)
     db.commit()
     
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.orm import Session
+
+from .. import embeddings, featurizers
+from ..auth import require_auth
+from ..book_apis import search_flight
+from ..cache import persistent_cache, search_cache
+from ..database import get_db
+from ..resilience import breakers, hedgers, limiters
+
+router = APIRouter()
+
+
+@router.get("/")
+async def metrics(request: Request, db: Session = Depends(get_db)):
+    """Métricas das fontes externas e das recomendações"""
+    await require_auth(request, db)
+    return {
+        "search_cache": search_cache.stats(),
+        "persistent_cache": persistent_cache.stats() if persistent_cache else None,
+        "single_flight": search_flight.stats(),
+        "circuit_breakers": {name: b.stats() for name, b in breakers.items()},
+        "rate_limiters": {name: l.stats() for name, l in limiters.items()},
+        "hedging": {name: h.stats() for name, h in hedgers.items()},
+        "featurizer": featurizers.stats(),
+        "embeddings": embeddings.stats()
+    }
@@ -2,8 +2,10 @@ from fastapi import APIRouter, Request, Depends
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
+import asyncio
 import os
 
+from .. import embeddings
 from ..database import get_db
 from ..models import UserBook
 from ..auth import require_auth
@@ -13,6 +15,9 @@ from ..recommendation import (
     get_user_favorite_authors
 )
 from ..book_apis import UnifiedBookAPI
+from ..library import LibraryMembership
+from ..profiles import get_profile
+from ..resilience import PRIORITY_PREFETCH
 from ..templating import templates
 
 from ..config import settings
@@ -40,7 +45,7 @@ async def recommendations_page(request: Request, db: Session = Depends(get_db)):
         })
     
     # Gerar recomendações
-    recommendations = await get_recommendations(user_books, db)
+    recommendations = await get_recommendations(user.id, user_books, db)
     
     return templates.TemplateResponse("recommendations.html", {
         "request": request,
@@ -62,7 +67,7 @@ async def recommendations_content(request: Request, db: Session = Depends(get_db
             "request": request
         })
     
-    recommendations = await get_recommendations(user_books, db)
+    recommendations = await get_recommendations(user.id, user_books, db)
     
     return templates.TemplateResponse("partials/recommendations_content.html", {
         "request": request,
@@ -70,58 +75,36 @@ async def recommendations_content(request: Request, db: Session = Depends(get_db
     })
 
 
-async def get_recommendations(user_books, db: Session):
+async def get_recommendations(user_id: int, user_books, db: Session):
     """Gera recomendações baseadas nos livros do usuário"""
     
-    # Obter categorias e autores favoritos
-    favorite_categories = get_user_favorite_categories(user_books)
-    favorite_authors = get_user_favorite_authors(user_books)
+    # Perfil de gosto persistido (None no modo de TF-IDF por requisição)
+    profile = get_profile(db, user_id, user_books)
     
-    # Buscar candidatos usando API unificada
-    candidate_books = []
+    # Obter categorias e autores favoritos (do perfil ou agregados no banco)
+    if profile is not None:
+        favorite_categories = profile.top_categories(db)
+        favorite_authors = profile.top_authors(db)
+    else:
+        favorite_categories = get_user_favorite_categories(db, user_id)
+        favorite_authors = get_user_favorite_authors(db, user_id)
     
-    # Buscar por categorias favoritas (ambas APIs)
-    for category in favorite_categories[:3]:
-        try:
-            books = UnifiedBookAPI.search_books(
-                query=f'subject:{category}',
-                sources=['google', 'openlibrary'],
-                limit_per_source=8,
-                google_api_key=GOOGLE_BOOKS_API_KEY
-            )
-            
-            for book in books:
-                # Verificar se já não está na biblioteca
-                book_id = book['id']
-                exists = any(b.book_id == book_id for b in user_books)
-                
-                if not exists:
-                    candidate_books.append(book)
-                    
-        except Exception as e:
-            print(f"Erro ao buscar categoria {category}: {e}")
-            continue
-    
-    # Buscar por autores favoritos (ambas APIs)
-    for author in favorite_authors[:2]:
-        try:
-            books = UnifiedBookAPI.search_books(
-                query=f'author:{author}',
-                sources=['google', 'openlibrary'],
-                limit_per_source=5,
-                google_api_key=GOOGLE_BOOKS_API_KEY
-            )
-            
-            for book in books:
-                book_id = book['id']
-                exists = any(b.book_id == book_id for b in user_books)
-                
-                if not exists:
-                    candidate_books.append(book)
-                    
-        except Exception as e:
-            print(f"Erro ao buscar autor {author}: {e}")
-            continue
+    library = LibraryMembership.from_user_books(user_books)
+    
+    # Com o índice do catálogo, os candidatos são os vizinhos dos favoritos;
+    # as APIs externas ficam como fallback
+    candidate_books = []
+    if profile is not None:
+        candidate_books = embeddings.recommend_candidates(
+            db,
+            profile,
+            settings.ANN_CANDIDATES,
+            exclude=(b.book_id for b in user_books)
+        )
+    if not candidate_books:
+        candidate_books = await fetch_remote_candidates(
+            favorite_categories, favorite_authors, library, db
+        )
     
     # Remover duplicatas
     seen_ids = set()
@@ -136,8 +119,74 @@ async def get_recommendations(user_books, db: Session):
         recommendations = generate_recommendations(
             user_books,
             unique_candidates,
-            limit=12
+            db,
+            limit=12,
+            profile=profile
         )
         return recommendations
     
     return []
+
+
+async def fetch_remote_candidates(favorite_categories, favorite_authors, library, db: Session):
+    """Candidatos buscados nas APIs externas pelas categorias e autores favoritos"""
+    
+    # Montar todas as consultas de candidatos (categorias e autores favoritos)
+    queries = [
+        (f'subject:{category}', 8, f"categoria {category}")
+        for category in favorite_categories[:3]
+    ] + [
+        (f'author:{author}', 5, f"autor {author}")
+        for author in favorite_authors[:2]
+    ]
+    
+    # Disparar todas ao mesmo tempo, uma tarefa por (consulta, fonte): assim
+    # uma fonte lenta não descarta o que a outra já devolveu
+    sources = ['google', 'openlibrary']
+    tasks = [
+        [
+            asyncio.create_task(UnifiedBookAPI.search_books(
+                query=query,
+                sources=[source],
+                limit_per_source=limit,
+                google_api_key=GOOGLE_BOOKS_API_KEY,
+                db=db,
+                priority=PRIORITY_PREFETCH
+            ))
+            for source in sources
+        ]
+        for query, limit, _ in queries
+    ]
+    all_tasks = [task for query_tasks in tasks for task in query_tasks]
+    
+    # Prazo global: o que não chegou a tempo é descartado e o scoring
+    # começa com os candidatos disponíveis
+    candidate_books = []
+    if all_tasks:
+        _, pending = await asyncio.wait(
+            all_tasks,
+            timeout=settings.RECOMMENDATION_DEADLINE
+        )
+        for task in pending:
+            task.cancel()
+        
+        # Percorrer na ordem das consultas para manter a prioridade
+        # (categorias antes de autores, Google antes de Open Library)
+        for query_tasks, (_, _, label) in zip(tasks, queries):
+            books = []
+            for task, source in zip(query_tasks, sources):
+                if task in pending:
+                    print(f"Prazo esgotado ao buscar {label} ({source})")
+                    continue
+                
+                try:
+                    books.extend(task.result())
+                except Exception as e:
+                    print(f"Erro ao buscar {label} ({source}): {e}")
+            
+            # Descartar o que já está na biblioteca
+            candidate_books.extend(
+                library.exclude(UnifiedBookAPI._remove_duplicates(books))
+            )
+    
+    return candidate_books
@@ -0,0 +1,188 @@
+"""
+Busca full-text no catálogo local
+
+- SQLite: tabela virtual FTS5 (`books_fts`) sincronizada por triggers e
+  ligada a `books.pk` (alias do rowid, estável num VACUUM)
+- Postgres: coluna `tsvector` gerada + índice GIN
+
+Sem suporte a full-text (ex.: SQLite compilado sem FTS5), cai para a busca
+com LIKE de `catalog.search_local`.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .catalog import row_to_book, search_local
+from .models import Book
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_SQLITE_SETUP = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, authors, description, categories,
+        content='books', content_rowid='pk',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, title, authors, description, categories)
+        VALUES (new.pk, new.title, new.authors, new.description, new.categories);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, authors, description, categories)
+        VALUES ('delete', old.pk, old.title, old.authors, old.description, old.categories);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE ON books BEGIN
+        INSERT INTO books_fts (books_fts, rowid, title, authors, description, categories)
+        VALUES ('delete', old.pk, old.title, old.authors, old.description, old.categories);
+        INSERT INTO books_fts (rowid, title, authors, description, categories)
+        VALUES (new.pk, new.title, new.authors, new.description, new.categories);
+    END
+    """,
+]
+
+_POSTGRES_SETUP = [
+    """
+    ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(authors, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(categories, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'D')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_books_search_vector ON books USING GIN (search_vector)",
+]
+
+# Disponibilidade detectada em ensure_search_index (None = ainda não verificado)
+_fts_available: Optional[bool] = None
+
+
+def ensure_search_index(engine: Engine) -> bool:
+    """
+    Criar (se necessário) a estrutura de full-text do dialeto atual
+
+    Returns:
+        True se a busca full-text está disponível
+    """
+    global _fts_available
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == 'sqlite':
+                existed = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'books_fts'"
+                )).first() is not None
+                for statement in _SQLITE_SETUP:
+                    conn.execute(text(statement))
+                if not existed:
+                    # Indexar os livros que já estavam no catálogo
+                    conn.execute(text("INSERT INTO books_fts (books_fts) VALUES ('rebuild')"))
+            elif dialect == 'postgresql':
+                for statement in _POSTGRES_SETUP:
+                    conn.execute(text(statement))
+            else:
+                _fts_available = False
+                return False
+        _fts_available = True
+    except Exception as e:
+        print(f"⚠️ AVISO: busca full-text indisponível ({e}); usando LIKE")
+        _fts_available = False
+    return _fts_available
+
+
+def _parse_query(query: str) -> Tuple[Optional[str], List[str]]:
+    """Separar prefixo (subject:/author:) e termos da consulta"""
+    query = query.strip()
+    field = None
+    for prefix, column in (('subject:', 'categories'), ('author:', 'authors')):
+        if query.lower().startswith(prefix):
+            field = column
+            query = query[len(prefix):]
+            break
+    return field, [t.lower() for t in TOKEN_RE.findall(query)]
+
+
+def _sqlite_match(field: Optional[str], tokens: List[str]) -> str:
+    """Expressão MATCH do FTS5 (termos sempre entre aspas)"""
+    if field:
+        # Prefixos viram frase exata na coluna correspondente
+        return f'{field} : "{" ".join(tokens)}"'
+    return ' AND '.join(f'"{t}"*' for t in tokens)
+
+
+def _postgres_tsquery(field: Optional[str], tokens: List[str]) -> str:
+    """Expressão para to_tsquery (termos entre aspas simples)"""
+    if field:
+        weight = {'authors': 'B', 'categories': 'C'}[field]
+        return ' <-> '.join(f"'{t}':{weight}" for t in tokens)
+    return ' & '.join(f"'{t}':*" for t in tokens)
+
+
+def search(
+    db: Session,
+    query: str,
+    limit: int = 20,
+    sources: Optional[Iterable[str]] = None
+) -> List[Dict]:
+    """
+    Buscar no catálogo local com o índice full-text
+
+    Args:
+        db: Sessão do banco
+        query: Termo de busca (aceita os prefixos subject: e author:)
+        limit: Número máximo de resultados
+        sources: Só livros vindos destas fontes (None = todas)
+
+    Returns:
+        Lista de livros no formato padrão, do mais relevante ao menos
+    """
+    if _fts_available is None:
+        ensure_search_index(db.get_bind())
+    if not _fts_available:
+        return search_local(db, query, limit, sources=sources)
+
+    field, tokens = _parse_query(query)
+    if not tokens:
+        return []
+
+    source_filter = " AND books.source IN :sources" if sources is not None else ""
+    if db.get_bind().dialect.name == 'sqlite':
+        # Pesos do bm25 por coluna: title, authors, description, categories
+        stmt = text(
+            "SELECT books.id FROM books_fts"
+            " JOIN books ON books.pk = books_fts.rowid"
+            " WHERE books_fts MATCH :q" + source_filter +
+            " ORDER BY bm25(books_fts, 10.0, 5.0, 1.0, 3.0), books.rating DESC"
+            " LIMIT :limit"
+        )
+        params = {'q': _sqlite_match(field, tokens), 'limit': limit}
+    else:
+        stmt = text(
+            "SELECT id FROM books, to_tsquery('simple', :q) AS query"
+            " WHERE search_vector @@ query" + source_filter +
+            " ORDER BY ts_rank_cd(search_vector, query) DESC, rating DESC"
+            " LIMIT :limit"
+        )
+        params = {'q': _postgres_tsquery(field, tokens), 'limit': limit}
+    if sources is not None:
+        stmt = stmt.bindparams(bindparam('sources', expanding=True))
+        params['sources'] = list(sources)
+
+    ids = [row[0] for row in db.execute(stmt, params)]
+    if not ids:
+        return []
+
+    # Carregar as linhas e manter a ordem de relevância
+    rows = {row.id: row for row in db.query(Book).filter(Book.id.in_(ids))}
+    return [row_to_book(rows[book_id]) for book_id in ids if book_id in rows]
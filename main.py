@@ -1,4 +1,5 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI, Request, Depends, HTTPException, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
@@ -8,9 +9,14 @@ from sqlalchemy.orm import Session
 
 # Imports da aplicação
 from app.database import engine, get_db, Base
-from app.models import User, UserBook
+from app.models import User
 from app.auth import get_current_user_from_cookie, create_access_token, verify_password, get_password_hash
-from app.routers import books, recommendations
+from app.routers import books, recommendations, metrics
+from app.http_client import startup_http_client, shutdown_http_client
+from app.search_index import ensure_search_index
+from app.migrations import run_migrations
+from app.library import get_library_stats
+from app import embeddings, featurizers
 
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -21,8 +27,20 @@ STATIC_DIR = BASE_DIR / "static"
 
 # Criar tabelas
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
+ensure_search_index(engine)
 
-app = FastAPI(title="BookBrain Modern")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Recursos compartilhados abertos no startup e fechados no shutdown"""
+    await startup_http_client()
+    featurizers.load()
+    embeddings.load()
+    yield
+    await shutdown_http_client()
+
+
+app = FastAPI(title="BookBrain Modern", lifespan=lifespan)
 
 # Configurar arquivos estáticos (com verificação de segurança)
 if STATIC_DIR.exists():
@@ -36,6 +54,7 @@ templates = Jinja2Templates(directory=TEMPLATES_DIR)
 # Incluir routers
 app.include_router(books.router, prefix="/books", tags=["books"])
 app.include_router(recommendations.router, prefix="/recommendations", tags=["recommendations"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -130,23 +149,15 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    # Estatísticas
-    total_books = db.query(UserBook).filter(UserBook.user_id == user.id).count()
-    reading = db.query(UserBook).filter(
-        UserBook.user_id == user.id,
-        UserBook.status == "reading"
-    ).count()
-    finished = db.query(UserBook).filter(
-        UserBook.user_id == user.id,
-        UserBook.status == "finished"
-    ).count()
+    # Estatísticas (um GROUP BY ou os contadores de user_stats)
+    stats = get_library_stats(db, user.id)
     
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
         "user": user,
-        "total_books": total_books,
-        "reading": reading,
-        "finished": finished
+        "total_books": stats['total'],
+        "reading": stats['reading'],
+        "finished": stats['finished']
     })
 
 
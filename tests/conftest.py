@@ -0,0 +1,87 @@
+"""
+Configuração dos testes: banco SQLite temporário e catálogo sintético
+
+As variáveis de ambiente precisam existir antes de importar `app` (as
+configurações e a engine são criadas na importação).
+"""
+import os
+import random
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="bookbrain-tests-")
+os.environ["SECRET_KEY"] = "test"
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+
+import pytest
+from sqlalchemy import text
+
+from app import featurizers, search_index
+from app.catalog import upsert_books
+from app.config import settings
+from app.database import Base, SessionLocal, engine
+from app.models import User
+
+
+TOPICS = 8
+
+
+def make_catalog(n: int = 400, seed: int = 0):
+    """Livros com vocabulário por tópico, autores e categorias repetidos"""
+    rng = random.Random(seed)
+    topics = [[f"t{k}w{j}" for j in range(15)] for k in range(TOPICS)]
+    common = [f"c{j}" for j in range(200)]
+    return [
+        {
+            'id': f'ol_{i}',
+            'title': f'Livro {i}',
+            'authors': [f'Autor {i % 25}'],
+            'description': ' '.join(rng.choices(topics[i % TOPICS], k=12) + rng.choices(common, k=4)),
+            'categories': [f'Topic {i % TOPICS}'],
+            'rating': rng.choice([0, 3.9, 4.2, 4.7]),
+            'source': 'openlibrary'
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+        # O índice full-text não faz parte dos modelos
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS books_fts"))
+        search_index._fts_available = None
+
+
+@pytest.fixture
+def catalog(db):
+    books = make_catalog()
+    upsert_books(db, books)
+    return books
+
+
+@pytest.fixture
+def user(db):
+    user = User(username="leitor", email="leitor@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def hashing_vectorizer(monkeypatch):
+    """Vetorizador estável (hashing sem IDF), como em produção com perfil de gosto"""
+    monkeypatch.setattr(settings, 'RECOMMENDATION_FEATURIZER', 'hashing')
+    monkeypatch.setattr(settings, 'HASHING_IDF_PATH', None)
+    monkeypatch.setattr(settings, 'HASHING_N_FEATURES', 2 ** 12)
+    monkeypatch.setattr(settings, 'PROFILE_CACHE_ENABLED', True)
+    featurizers.load()
+    yield featurizers.get_vectorizer()
+    monkeypatch.undo()
+    featurizers.load()
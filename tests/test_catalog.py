@@ -0,0 +1,95 @@
+"""
+Catálogo local: importação do dump e espelhamento das buscas
+"""
+import asyncio
+import json
+
+from app.book_apis import OpenLibraryAPI, UnifiedBookAPI
+from app.ingest import ingest
+from app.models import Book, UserBook
+from app.routers import books as books_router
+
+
+DUNE = {
+    'key': '/works/OL893415W',
+    'title': 'Dune',
+    'description': 'A long, rich description of Arrakis and the spice.',
+    'subjects': ['Science fiction', 'Deserts', 'Ecology'],
+    'first_publish_date': '1965',
+}
+
+
+def test_search_mirror_keeps_ingested_description(db, tmp_path, monkeypatch):
+    dump = tmp_path / 'works.txt'
+    dump.write_text(json.dumps(DUNE) + '\n', encoding='utf-8')
+    assert ingest(str(dump)) == 1
+
+    async def fake_search(query, limit, priority):
+        # A busca só devolve os subjects, sem a descrição do dump
+        return [OpenLibraryAPI._format_book({
+            'key': DUNE['key'],
+            'title': 'Dune',
+            'first_publish_year': 1965,
+            'subject': ['Fiction'],
+        })]
+
+    monkeypatch.setattr(OpenLibraryAPI, '_fetch_search', staticmethod(fake_search))
+    books = asyncio.run(UnifiedBookAPI.search_books(
+        'dune mirror test', sources=['openlibrary'], limit_per_source=10, db=db
+    ))
+    assert [book['id'] for book in books] == ['ol_OL893415W']
+
+    db.expire_all()
+    row = db.get(Book, 'ol_OL893415W')
+    assert row.description == DUNE['description']
+    assert row.categories == 'Science fiction,Deserts,Ecology'
+
+
+class _Response:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def test_add_book_resolves_catalog_row_on_server(db, user, monkeypatch):
+    pages = {
+        f'{OpenLibraryAPI.BASE_URL}/works/OL893415W.json': {
+            'title': 'Dune',
+            'description': {'value': DUNE['description']},
+            'subjects': DUNE['subjects'],
+            'authors': [{'author': {'key': '/authors/OL79034A'}}],
+        },
+        f'{OpenLibraryAPI.BASE_URL}/authors/OL79034A.json': {'name': 'Frank Herbert'},
+    }
+    requested = []
+
+    async def fake_get(url, params=None, priority=None):
+        requested.append(url)
+        return _Response(pages[url])
+
+    async def fake_auth(request, db):
+        return user
+
+    monkeypatch.setattr(OpenLibraryAPI, '_get', staticmethod(fake_get))
+    monkeypatch.setattr(books_router, 'require_auth', fake_auth)
+
+    response = asyncio.run(books_router.add_book(None, book_id='ol_OL893415W', db=db))
+    assert 'Adicionado' in response.body.decode()
+    row = db.get(Book, 'ol_OL893415W')
+    assert (row.title, row.authors, row.description) == ('Dune', 'Frank Herbert', DUNE['description'])
+
+    # Já no catálogo: nenhuma ida à fonte
+    requested.clear()
+    db.query(UserBook).delete()
+    db.commit()
+    asyncio.run(books_router.add_book(None, book_id='ol_OL893415W', db=db))
+    assert requested == []
+
+    # IDs desconhecidos ou que não casam com o formato não criam nada
+    for book_id in ('ol_../../admin', 'xx_1', 'gb_a/b'):
+        response = asyncio.run(books_router.add_book(None, book_id=book_id, db=db))
+        assert 'não encontrado' in response.body.decode()
+    assert requested == []
+    assert db.query(Book).count() == 1
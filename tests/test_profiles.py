@@ -0,0 +1,106 @@
+"""
+O perfil de gosto atualizado incrementalmente deve ser igual ao montado do zero
+"""
+import random
+
+from app.catalog import upsert_books
+from app.models import UserBook, UserProfile
+from app.profiles import TasteProfile, build_profile, get_profile, update_profile
+from app.recommendation import get_user_favorite_authors, get_user_favorite_categories
+
+
+def _state(book):
+    return (book.user_rating, book.status)
+
+
+def _apply_random_changes(db, user, rng, steps=80):
+    """Mesma sequência das rotas de /books: perfil atualizado antes do commit"""
+    for _ in range(steps):
+        library = db.query(UserBook).filter(UserBook.user_id == user.id).all()
+        in_library = {b.book_id for b in library}
+        op = rng.choice(['add', 'add', 'rate', 'rate', 'status', 'delete'])
+
+        if op == 'add' or not library:
+            book_id = f'ol_{rng.randrange(400)}'
+            if book_id in in_library:
+                continue
+            db.add(UserBook(user_id=user.id, book_id=book_id, status='want_to_read'))
+            update_profile(db, user.id, book_id, None, (None, 'want_to_read'))
+        else:
+            book = rng.choice(library)
+            if op == 'rate':
+                rating = rng.randint(1, 5)
+                update_profile(db, user.id, book.book_id, _state(book), (rating, book.status))
+                book.user_rating = rating
+            elif op == 'status':
+                status = rng.choice(['want_to_read', 'reading', 'finished'])
+                update_profile(db, user.id, book.book_id, _state(book), (book.user_rating, status))
+                book.status = status
+            else:
+                update_profile(db, user.id, book.book_id, _state(book), None)
+                db.delete(book)
+        db.commit()
+
+
+def test_incremental_profile_equals_fresh_build(db, catalog, user, hashing_vectorizer):
+    rng = random.Random(7)
+    for i in rng.sample(range(400), 10):
+        db.add(UserBook(user_id=user.id, book_id=f'ol_{i}', user_rating=rng.randint(1, 5), status='finished'))
+    db.commit()
+    user_books = db.query(UserBook).filter(UserBook.user_id == user.id).all()
+    get_profile(db, user.id, user_books)
+
+    _apply_random_changes(db, user, rng)
+
+    user_books = db.query(UserBook).filter(UserBook.user_id == user.id).all()
+    incremental = TasteProfile.loads(db.get(UserProfile, user.id).data)
+    fresh = build_profile(db, user_books, incremental.signature)
+
+    assert incremental.favorites.keys() == fresh.favorites.keys()
+    assert incremental.hated.keys() == fresh.hated.keys()
+    for kept, rebuilt in ((incremental.favorites, fresh.favorites), (incremental.hated, fresh.hated)):
+        for book_id, vector in kept.items():
+            assert (vector != rebuilt[book_id]).nnz == 0
+    assert incremental.category_scores == fresh.category_scores
+    assert incremental.author_scores == fresh.author_scores
+    assert incremental.favorite_categories == fresh.favorite_categories
+    assert incremental.favorite_authors == fresh.favorite_authors
+
+    # E os favoritos derivados batem com a agregação no banco
+    assert incremental.top_categories(db) == get_user_favorite_categories(db, user.id)
+    assert incremental.top_authors(db) == get_user_favorite_authors(db, user.id)
+
+
+def test_profile_survives_catalog_link_changes(db, catalog, user, hashing_vectorizer):
+    books = {book['id']: book for book in catalog}
+    for book_id, rating in (('ol_1', 5), ('ol_9', 5), ('ol_2', 4)):
+        db.add(UserBook(user_id=user.id, book_id=book_id, user_rating=rating, status='finished'))
+    db.commit()
+    user_books = db.query(UserBook).filter(UserBook.user_id == user.id).all()
+    get_profile(db, user.id, user_books)
+
+    # O catálogo troca as ligações de livros que já estão na biblioteca
+    upsert_books(db, [
+        dict(books['ol_1'], categories=['Topic 2'], authors=['Autor 2']),
+        dict(books['ol_9'], categories=['Topic 1', 'Topic 2']),
+    ])
+
+    first, second = (
+        db.query(UserBook).filter(UserBook.user_id == user.id, UserBook.book_id == book_id).one()
+        for book_id in ('ol_1', 'ol_9')
+    )
+    update_profile(db, user.id, 'ol_1', _state(first), (4, first.status))
+    first.user_rating = 4
+    db.commit()
+    update_profile(db, user.id, 'ol_9', _state(second), None)
+    db.delete(second)
+    db.commit()
+
+    user_books = db.query(UserBook).filter(UserBook.user_id == user.id).all()
+    incremental = TasteProfile.loads(db.get(UserProfile, user.id).data)
+    fresh = build_profile(db, user_books, incremental.signature)
+    assert incremental.category_scores == fresh.category_scores
+    assert incremental.author_scores == fresh.author_scores
+    assert incremental.favorite_categories == fresh.favorite_categories
+    assert incremental.favorite_authors == fresh.favorite_authors
+    assert incremental.links == fresh.links
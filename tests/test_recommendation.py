@@ -0,0 +1,199 @@
+"""
+O scoring vetorizado de `generate_recommendations` deve devolver exatamente
+os mesmos ids, scores e motivos do scoring livro a livro que ele substituiu
+"""
+import asyncio
+import random
+
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import cosine_similarity
+from sqlalchemy import event
+
+from app import embeddings, featurizers
+from app.book_apis import GoogleBooksAPI, OpenLibraryAPI
+from app.catalog import linked_ids, lookup_name_ids, name_key
+from app.database import engine
+from app.models import Author, Category, UserBook
+from app.profiles import get_profile
+from app.recommendation import generate_recommendations
+from app.routers.recommendations import get_recommendations
+
+
+def reference_recommendations(user_books, candidate_books, db, limit=12, profile=None):
+    """Scoring livro a livro, como era antes da vetorização"""
+    favorites = [
+        b for b in user_books
+        if (b.user_rating and b.user_rating >= 3.5) or (b.status == "finished" and not b.user_rating)
+    ]
+    hated_books = [b for b in user_books if b.user_rating and b.user_rating <= 2.5]
+    if not favorites or not candidate_books:
+        return []
+
+    cand_descriptions = [
+        featurizers.document_text(b.get('description', ''), b.get('title', ''))
+        for b in candidate_books
+    ]
+    if profile is not None:
+        vectorizer = featurizers.get_vectorizer()
+        fav_vectors = profile.favorite_vectors()
+        hated_vectors = profile.hated_vectors()
+    else:
+        fav_descriptions = [featurizers.document_text(b.description, b.title) for b in favorites]
+        hated_descriptions = [featurizers.document_text(b.description, b.title) for b in hated_books]
+        vectorizer = featurizers.get_vectorizer()
+        if vectorizer is None:
+            vectorizer = featurizers.fit_request_vectorizer(
+                fav_descriptions + hated_descriptions + cand_descriptions
+            )
+        fav_vectors = vectorizer.transform(fav_descriptions)
+        hated_vectors = vectorizer.transform(hated_descriptions) if hated_books else None
+    cand_vectors = vectorizer.transform(cand_descriptions)
+
+    sim_favorites = cosine_similarity(cand_vectors, fav_vectors)
+    if sim_favorites.shape[1] >= 3:
+        semantic_scores = np.sort(sim_favorites, axis=1)[:, -3:].mean(axis=1)
+    else:
+        semantic_scores = sim_favorites.mean(axis=1)
+    penalty_scores = np.zeros(len(candidate_books))
+    if hated_vectors is not None and hated_vectors.shape[0] > 0:
+        penalty_scores = cosine_similarity(cand_vectors, hated_vectors).max(axis=1)
+
+    if profile is not None:
+        fav_cat_ids, fav_author_ids = set(profile.favorite_categories), set(profile.favorite_authors)
+    else:
+        fav_cat_ids, fav_author_ids = linked_ids(db, (f.book_id for f in favorites))
+    cat_ids = lookup_name_ids(db, Category, (
+        name_key(c) for book in candidate_books for c in book.get('categories', [])
+    ))
+    author_ids = lookup_name_ids(db, Author, (
+        name_key(a) for book in candidate_books for a in book.get('authors', [])
+    ))
+
+    recommendations = []
+    for i, book in enumerate(candidate_books):
+        score = 0.0
+        reasons = []
+        score += float(semantic_scores[i]) * 0.45
+        pen_score = float(penalty_scores[i])
+        if pen_score > 0.4:
+            score -= pen_score * 0.25
+        cat_match = [c for c in book.get('categories', []) if cat_ids.get(name_key(c)) in fav_cat_ids]
+        if cat_match:
+            score += 0.3
+            reasons.append(f"Gênero: {cat_match[0].strip().title()}")
+        author_match = [a for a in book.get('authors', []) if author_ids.get(name_key(a)) in fav_author_ids]
+        if author_match:
+            score += 0.15
+            reasons.append(f"Autor: {author_match[0].strip().title()}")
+        google_rating = book.get('rating', 0) or 0
+        if google_rating >= 4.5:
+            score += 0.1
+            reasons.append("Aclamado pela crítica")
+        elif google_rating >= 4.0:
+            score += 0.05
+        if score > 0.25:
+            recommendations.append({
+                'book': book,
+                'score': round(score, 3),
+                'reason': ' • '.join(reasons[:2]) if reasons else 'Baseado no seu perfil'
+            })
+    recommendations.sort(key=lambda x: x['score'], reverse=True)
+    return recommendations[:limit]
+
+
+def _summary(recommendations):
+    return [(r['book']['id'], r['score'], r['reason']) for r in recommendations]
+
+
+def _library(db, user, rng, size=25, with_hated=True):
+    """Biblioteca aleatória; sem `with_hated`, nenhuma nota baixa"""
+    ratings = [None, 1, 2, 3, 4, 5] if with_hated else [None, 3, 4, 5]
+    for i in rng.sample(range(400), size):
+        db.add(UserBook(
+            user_id=user.id,
+            book_id=f'ol_{i}',
+            user_rating=rng.choice(ratings),
+            status=rng.choice(['want_to_read', 'reading', 'finished'])
+        ))
+    db.commit()
+    return db.query(UserBook).filter(UserBook.user_id == user.id).all()
+
+
+def _candidates(catalog, rng):
+    """Candidatos com notas, categorias e autores variados (inclui nomes não cadastrados)"""
+    books = rng.sample(catalog, rng.randint(1, 400))
+    candidates = [
+        dict(
+            book,
+            rating=rng.choice([0, None, 3.9, 4.0, 4.2, 4.5, 4.7]),
+            categories=book['categories'] + rng.sample(['Topic 1', 'topic 2 ', 'Outra', 'Topic 3'], rng.randint(0, 2)),
+            authors=rng.sample(['Autor 1', 'autor 2', 'Zé', 'Autor 3'], rng.randint(0, 2)) + book['authors']
+        )
+        for book in books
+    ]
+    if rng.random() < 0.3:
+        # Sem texto em comum: empates de score
+        for book in candidates:
+            book['description'] = 'zzz'
+    return candidates
+
+
+@pytest.mark.parametrize('with_hated', [False, True])
+def test_vectorized_scoring_matches_reference(db, catalog, user, with_hated):
+    rng = random.Random(11)
+    user_books = _library(db, user, rng, with_hated=with_hated)
+    for _ in range(60):
+        candidates = _candidates(catalog, rng)
+        limit = rng.choice([1, 3, 5, 12, 50])
+        assert _summary(generate_recommendations(user_books, candidates, db, limit=limit)) == \
+            _summary(reference_recommendations(user_books, candidates, db, limit=limit))
+
+
+@pytest.mark.parametrize('with_hated', [False, True])
+def test_vectorized_scoring_with_profile_matches_reference(db, catalog, user, hashing_vectorizer, with_hated):
+    rng = random.Random(23)
+    user_books = _library(db, user, rng, with_hated=with_hated)
+    profile = get_profile(db, user.id, user_books)
+    assert profile is not None
+    for _ in range(60):
+        candidates = _candidates(catalog, rng)
+        limit = rng.choice([1, 3, 5, 12, 50])
+        for p in (None, profile):
+            assert _summary(generate_recommendations(user_books, candidates, db, limit=limit, profile=p)) == \
+                _summary(reference_recommendations(user_books, candidates, db, limit=limit, profile=p))
+
+
+def test_recommendations_do_not_reload_library(db, catalog, user, hashing_vectorizer, monkeypatch):
+    """O perfil e o espelho do catálogo gravam sem expirar os livros já carregados"""
+    rng = random.Random(5)
+    for i in range(200):
+        db.add(UserBook(user_id=user.id, book_id=f'ol_{i}', user_rating=rng.choice([None, 3, 4, 5]), status='finished'))
+    db.commit()
+    user_books = db.query(UserBook).filter(UserBook.user_id == user.id).all()
+
+    async def fake_openlibrary(query, limit, priority):
+        return [dict(book, id=f'ol_new_{i}') for i, book in enumerate(catalog[:limit])]
+
+    async def fake_google(query, api_key, limit, priority):
+        return []
+
+    monkeypatch.setattr(embeddings, '_index', None)
+    monkeypatch.setattr(embeddings, '_loaded', True)
+    monkeypatch.setattr(OpenLibraryAPI, '_fetch_search', staticmethod(fake_openlibrary))
+    monkeypatch.setattr(GoogleBooksAPI, '_fetch_search', staticmethod(fake_google))
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        asyncio.run(get_recommendations(user.id, user_books, db))
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    reloads = [s for s in statements if 'FROM user_books' in s and 'user_books.id = ?' in s]
+    assert reloads == []
+    assert len(statements) < 60
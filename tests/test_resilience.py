@@ -0,0 +1,247 @@
+"""
+Disjuntor, limitador de taxa, hedging e single-flight sob concorrência
+"""
+import asyncio
+import time
+
+import pytest
+
+from app.book_apis import SingleFlight
+from app.resilience import (
+    PRIORITY_INTERACTIVE,
+    PRIORITY_PREFETCH,
+    CircuitBreaker,
+    CircuitOpenError,
+    Hedger,
+    LatencyTracker,
+    RateLimitedError,
+    TokenBucket
+)
+
+
+class _Boom(Exception):
+    pass
+
+
+def _blocked(event, result='ok'):
+    """Chamada à fonte que só responde quando `event` for liberado"""
+    async def fn(timeout):
+        await event.wait()
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return fn
+
+
+async def _fail(timeout):
+    raise _Boom()
+
+
+async def _succeed(timeout):
+    return 'ok'
+
+
+async def _open(breaker):
+    with pytest.raises(_Boom):
+        await breaker.call(_fail)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_breaker_allows_a_single_probe_in_half_open():
+    async def scenario():
+        breaker = CircuitBreaker('teste', failure_threshold=1, recovery_time=0.01)
+        stale_release = asyncio.Event()
+        stale = asyncio.create_task(breaker.call(_blocked(stale_release, _Boom())))
+        await asyncio.sleep(0)
+        await _open(breaker)
+        await asyncio.sleep(0.02)
+
+        probe_release = asyncio.Event()
+        probe = asyncio.create_task(breaker.call(_blocked(probe_release)))
+        await asyncio.sleep(0)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(_succeed)
+
+        # Uma chamada antiga terminando não libera a vaga do teste
+        stale_release.set()
+        with pytest.raises(_Boom):
+            await stale
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(_succeed)
+
+        probe_release.set()
+        assert await probe == 'ok'
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.rejected == 2
+        assert await breaker.call(_succeed) == 'ok'
+
+    asyncio.run(scenario())
+
+
+def test_breaker_ignores_results_from_earlier_generations():
+    async def scenario():
+        breaker = CircuitBreaker('teste', failure_threshold=1, recovery_time=0.01)
+        late_success = asyncio.Event()
+        late_failure = asyncio.Event()
+        success = asyncio.create_task(breaker.call(_blocked(late_success)))
+        failure = asyncio.create_task(breaker.call(_blocked(late_failure, _Boom())))
+        await asyncio.sleep(0)
+        await _open(breaker)
+
+        # Sucesso de antes da abertura não fecha o circuito
+        late_success.set()
+        assert await success == 'ok'
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.successes == 0
+
+        await asyncio.sleep(0.02)
+        assert await breaker.call(_succeed) == 'ok'
+        assert breaker.state == CircuitBreaker.CLOSED
+
+        # Falha de antes do teste não reabre o circuito recuperado
+        late_failure.set()
+        with pytest.raises(_Boom):
+            await failure
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.failures == 1
+
+    asyncio.run(scenario())
+
+
+def test_bucket_serves_waiters_by_priority():
+    async def scenario():
+        bucket = TokenBucket(
+            'teste', rate=50, capacity=1,
+            max_wait={PRIORITY_INTERACTIVE: 2.0, PRIORITY_PREFETCH: 2.0}
+        )
+        await bucket.acquire()
+        served = []
+
+        async def acquire(name, priority):
+            await bucket.acquire(priority)
+            served.append(name)
+
+        await asyncio.gather(
+            acquire('prefetch-1', PRIORITY_PREFETCH),
+            acquire('interativa', PRIORITY_INTERACTIVE),
+            acquire('prefetch-2', PRIORITY_PREFETCH),
+        )
+        assert served == ['interativa', 'prefetch-1', 'prefetch-2']
+        assert bucket.queued == 3
+
+    asyncio.run(scenario())
+
+
+def test_bucket_acquire_times_out():
+    async def scenario():
+        bucket = TokenBucket(
+            'teste', rate=1, capacity=1,
+            max_wait={PRIORITY_INTERACTIVE: 0.05, PRIORITY_PREFETCH: 0}
+        )
+        await bucket.acquire()
+
+        started = time.monotonic()
+        with pytest.raises(RateLimitedError):
+            await bucket.acquire(PRIORITY_INTERACTIVE)
+        assert time.monotonic() - started < 0.5
+
+        # Sem espera permitida: recusa na hora, sem entrar na fila
+        with pytest.raises(RateLimitedError):
+            await bucket.acquire(PRIORITY_PREFETCH)
+        assert bucket.rejected == 2
+        assert bucket.queued == 1
+        assert bucket.granted == 1
+
+    asyncio.run(scenario())
+
+
+def _warm_hedger():
+    latencies = LatencyTracker()
+    for _ in range(Hedger.MIN_SAMPLES):
+        latencies.add(0.01)
+    return Hedger('teste', latencies, budget_ratio=1.0, min_delay=0.01)
+
+
+def test_hedger_cancels_the_losing_request():
+    async def scenario():
+        hedger = _warm_hedger()
+        calls = []
+        cancelled = []
+
+        async def fn():
+            attempt = len(calls)
+            calls.append(attempt)
+            try:
+                # A primária trava; a duplicata responde logo
+                await asyncio.sleep(10 if attempt == 0 else 0.001)
+            except asyncio.CancelledError:
+                cancelled.append(attempt)
+                raise
+            return attempt
+
+        assert await hedger.run(fn) == 1
+        await asyncio.sleep(0)
+        assert cancelled == [0]
+        assert (hedger.hedged, hedger.hedge_wins) == (1, 1)
+
+    asyncio.run(scenario())
+
+
+def test_hedger_cancelled_caller_cancels_both_requests():
+    async def scenario():
+        hedger = _warm_hedger()
+        started = []
+        cancelled = []
+
+        async def fn():
+            attempt = len(started)
+            started.append(attempt)
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(attempt)
+                raise
+
+        caller = asyncio.create_task(hedger.run(fn))
+        await asyncio.sleep(0.05)
+        assert len(started) == 2
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+        assert sorted(cancelled) == [0, 1]
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_survives_a_cancelled_caller():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await release.wait()
+            return 'livros'
+
+        leader = asyncio.create_task(flight.do('chave', fn))
+        follower = asyncio.create_task(flight.do('chave', fn))
+        await asyncio.sleep(0)
+
+        # O chamador que iniciou a busca desiste; a busca continua para o outro
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        late = asyncio.create_task(flight.do('chave', fn))
+        await asyncio.sleep(0)
+
+        release.set()
+        assert await follower == 'livros'
+        assert await late == 'livros'
+        assert len(calls) == 1
+        assert flight.stats() == {'in_flight': 0, 'leaders': 1, 'followers': 2}
+
+    asyncio.run(scenario())
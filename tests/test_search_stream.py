@@ -0,0 +1,49 @@
+"""
+Busca em streaming (SSE): o evento "done" sai sempre, mesmo com erro no meio
+"""
+import asyncio
+
+from app.book_apis import UnifiedBookAPI
+from app.library import LibraryMembership
+from app.routers import books as books_router
+
+
+class _Request:
+    async def is_disconnected(self):
+        return False
+
+
+def _events(body):
+    return [chunk.split('\n', 1)[0] for chunk in body.split('\n\n') if chunk]
+
+
+def test_stream_sends_done_after_a_failure(db, user, monkeypatch):
+    async def fake_search(query, sources, **kwargs):
+        return [{
+            'id': f'ol_{sources[0]}', 'title': f'Livro {sources[0]}', 'authors': [], 'description': '',
+            'categories': [], 'rating': 0, 'thumbnail': '', 'source': 'openlibrary'
+        }]
+
+    calls = []
+    original = LibraryMembership.for_books.__func__
+
+    def flaky_for_books(cls, db, user_id, book_ids):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("banco indisponível")
+        return original(cls, db, user_id, book_ids)
+
+    async def fake_auth(request, db):
+        return user
+
+    monkeypatch.setattr(UnifiedBookAPI, 'search_books', staticmethod(fake_search))
+    monkeypatch.setattr(LibraryMembership, 'for_books', classmethod(flaky_for_books))
+    monkeypatch.setattr(books_router, 'require_auth', fake_auth)
+
+    async def collect():
+        response = await books_router.search_books_stream(_Request(), q='livro', source='all', db=db)
+        return ''.join([chunk async for chunk in response.body_iterator])
+
+    body = asyncio.run(collect())
+    assert _events(body) == ['event: results', 'event: done']
+    assert 'Erro ao buscar' in body